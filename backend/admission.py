@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Resident memory of a warm worker before it loads any data
+BASE_JOB_MB = 300
+# Peak resident bytes per byte of uncompressed input: the DataFrame, the
+# preprocessed dict copy and dedupe's working set
+MEMORY_EXPANSION = 12
+# Rough uncompressed size of an .xlsx relative to its file size
+XLSX_EXPANSION = 6
+# Resident memory the out-of-core store allows on top of the base worker
+OUT_OF_CORE_JOB_MB = 512
+
+def _detect_memory_mb() -> int:
+    """Memory available to this container, honouring cgroup limits"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value != 'max' and int(value) < 1 << 60:
+                return int(value) // MB
+        except (OSError, ValueError):
+            continue
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // MB
+
+def _count_rows(file_path: str) -> int:
+    """Count data rows without parsing the file"""
+    if file_path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            return max((workbook.active.max_row or 1) - 1, 0)
+        finally:
+            workbook.close()
+    if file_path.endswith('.xls'):
+        # No cheap row count for legacy .xls, assume ~100 bytes per row
+        return os.path.getsize(file_path) // 100
+    rows = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            rows += block.count(b'\n')
+    return max(rows - 1, 0)
+
+@dataclass
+class JobCost:
+    rows: int
+    memory_mb: int
+
+def estimate_job_cost(file_paths: List[str], out_of_core: bool = False) -> JobCost:
+    """
+    Estimate the peak memory of a job from its input files
+
+    Args:
+        file_paths: Uploaded files
+        out_of_core: Whether the job keeps records on disk
+
+    Returns:
+        JobCost with the total row count and estimated peak memory in MB
+    """
+    rows = 0
+    uncompressed_bytes = 0
+    for file_path in file_paths:
+        size = os.path.getsize(file_path)
+        uncompressed_bytes += size * XLSX_EXPANSION if file_path.endswith(('.xlsx', '.xls')) else size
+        rows += _count_rows(file_path)
+
+    if out_of_core:
+        memory_mb = BASE_JOB_MB + OUT_OF_CORE_JOB_MB
+    else:
+        memory_mb = BASE_JOB_MB + math.ceil(uncompressed_bytes * MEMORY_EXPANSION / MB)
+    return JobCost(rows=rows, memory_mb=memory_mb)
+
+class AdmissionRejected(Exception):
+    """Raised when a job cannot be admitted; retry_after is a hint in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _Waiter:
+    def __init__(self, cost: JobCost):
+        self.cost = cost
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class AdmissionController:
+    """
+    Admits jobs while their estimated memory fits the budget and a worker is free
+
+    Waiting jobs are granted strictly first-in first-out, so a large job at the
+    head of the queue is not starved by a stream of small ones. When the queue
+    is full or a job waits longer than queue_timeout, it is rejected with a
+    retry hint derived from recent job durations.
+    """
+
+    def __init__(
+        self,
+        max_running: int,
+        memory_budget_mb: Optional[int] = None,
+        max_queued: int = 20,
+        queue_timeout: float = 300
+    ):
+        self.max_running = max_running
+        self.memory_budget_mb = memory_budget_mb or int(_detect_memory_mb() * 0.8)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.memory_in_use_mb = 0
+        self._queue: Deque[_Waiter] = deque()
+        # Exponentially weighted mean job duration, seeds the retry hint
+        self._mean_duration = 60.0
+
+    def _fits(self, cost: JobCost) -> bool:
+        if self.running >= self.max_running:
+            return False
+        # A job larger than the whole budget may still run on its own
+        return self.running == 0 or self.memory_in_use_mb + cost.memory_mb <= self.memory_budget_mb
+
+    def _grant(self, cost: JobCost):
+        self.running += 1
+        self.memory_in_use_mb += cost.memory_mb
+
+    def _wake_waiters(self):
+        while self._queue and self._fits(self._queue[0].cost):
+            waiter = self._queue.popleft()
+            if waiter.future.done():
+                continue
+            self._grant(waiter.cost)
+            waiter.future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Seconds until a new job is likely to be admitted"""
+        waves = (len(self._queue) + self.running) / max(self.max_running, 1)
+        return max(1, math.ceil(waves * self._mean_duration))
+
+    async def acquire(self, cost: JobCost):
+        if cost.memory_mb > self.memory_budget_mb:
+            logger.warning(
+                f"Job estimated at {cost.memory_mb} MB exceeds the {self.memory_budget_mb} MB budget; "
+                f"it will only run alone"
+            )
+        if not self._queue and self._fits(cost):
+            self._grant(cost)
+            return
+
+        if len(self._queue) >= self.max_queued:
+            raise AdmissionRejected("Server is at capacity, job queue is full", self.retry_after())
+
+        waiter = _Waiter(cost)
+        self._queue.append(waiter)
+        logger.info(f"Queued job estimated at {cost.memory_mb} MB, position {len(self._queue)}")
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # Granted at the moment the timeout fired; keep the slot
+                return
+            waiter.future.cancel()
+            self._queue.remove(waiter)
+            raise AdmissionRejected("Timed out waiting for capacity", self.retry_after())
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release(cost, None)
+            else:
+                waiter.future.cancel()
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+            raise
+
+    def release(self, cost: JobCost, duration: Optional[float]):
+        self.running -= 1
+        self.memory_in_use_mb -= cost.memory_mb
+        if duration is not None:
+            self._mean_duration = 0.8 * self._mean_duration + 0.2 * duration
+        self._wake_waiters()
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running,
+            'queued': len(self._queue),
+            'memory_in_use_mb': self.memory_in_use_mb,
+            'memory_budget_mb': self.memory_budget_mb
+        }
+
+class AdmittedJob:
+    """Async context manager that holds an admission slot for the job's lifetime"""
+
+    def __init__(self, controller: AdmissionController, cost: JobCost):
+        self.controller = controller
+        self.cost = cost
+        self._start = 0.0
+
+    async def __aenter__(self):
+        await self.controller.acquire(self.cost)
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.controller.release(self.cost, time.monotonic() - self._start)
+        return False
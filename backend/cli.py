@@ -0,0 +1,232 @@
+"""
+Command-line entry point for headless deduplication runs
+
+Example:
+    python cli.py 'exports/KNA*.xlsx' -o duplicates.parquet \
+        --settings-file learned_settings --training-file labels.json \
+        --out-of-core --memory-limit-mb 6144 --cores 4
+"""
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson'
+}
+
+# Columns written after the record fields, as in the frontend's CSV download
+META_COLUMNS = ['record_id', 'confidence_score', 'source_file']
+
+# Rows buffered per Parquet row group
+PARQUET_BATCH_SIZE = 10000
+
+def expand_inputs(patterns: List[str]) -> List[str]:
+    """Expand glob patterns into a sorted, de-duplicated list of files"""
+    file_paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise FileNotFoundError(f"No files match {pattern}")
+        for match in matches:
+            if match not in file_paths:
+                file_paths.append(match)
+    return file_paths
+
+def load_training_labels(path: str) -> List[Dict]:
+    """Load labelled pairs, either a plain list or wrapped in {"pairs": [...]}"""
+    with open(path, 'r') as f:
+        labels = json.load(f)
+    if isinstance(labels, dict):
+        labels = labels.get('pairs', [])
+    return labels
+
+def iter_result_rows(results: List[Dict]) -> Iterator[Dict]:
+    """Flatten clusters into one row per record"""
+    for cluster in results:
+        for record in cluster['records']:
+            row = {'cluster_id': cluster['cluster_id']}
+            row.update({k: v for k, v in record.items() if k not in META_COLUMNS})
+            row['record_id'] = record['record_id']
+            row['confidence_score'] = float(record['confidence_score'])
+            row['source_file'] = record['source_file']
+            yield row
+
+def result_columns(results: List[Dict]) -> List[str]:
+    """Return the output columns in first-seen order, with the meta columns last"""
+    fields = {}
+    for cluster in results:
+        for record in cluster['records']:
+            fields.update((k, None) for k in record if k not in META_COLUMNS)
+    return ['cluster_id'] + list(fields) + META_COLUMNS
+
+def import_pyarrow():
+    """Import pyarrow for Parquet output, with an install hint if it is missing"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+    return pa, pq
+
+def write_results(results: List[Dict], output_file: str, output_format: str) -> int:
+    """
+    Write results row by row in the requested format
+
+    Args:
+        results: Clusters as returned by find_duplicates_in_files
+        output_file: Destination path
+        output_format: 'csv', 'parquet' or 'ndjson'
+
+    Returns:
+        Number of rows written
+    """
+    if not results:
+        open(output_file, 'w').close()
+        return 0
+    # Files can have different columns, so the header covers every record
+    columns = result_columns(results)
+    written = 0
+
+    if output_format == 'csv':
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            for row in iter_result_rows(results):
+                writer.writerow(row)
+                written += 1
+    elif output_format == 'ndjson':
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for row in iter_result_rows(results):
+                f.write(json.dumps(row) + '\n')
+                written += 1
+    elif output_format == 'parquet':
+        pa, pq = import_pyarrow()
+
+        schema = pa.schema([
+            (column, pa.float64() if column == 'confidence_score' else pa.int64() if column == 'cluster_id' else pa.string())
+            for column in columns
+        ])
+        with pq.ParquetWriter(output_file, schema) as writer:
+            batch = []
+            for row in iter_result_rows(results):
+                batch.append(row)
+                if len(batch) >= PARQUET_BATCH_SIZE:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    written += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                written += len(batch)
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+
+    return written
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Find duplicates in CSV and Excel files without going through the HTTP API"
+    )
+    parser.add_argument('inputs', nargs='+', help="Input files or glob patterns")
+    parser.add_argument('-o', '--output', required=True, help="Output file (.csv, .parquet, .ndjson)")
+    parser.add_argument('--format', choices=sorted(set(OUTPUT_FORMATS.values())),
+                        help="Output format, inferred from the output extension by default")
+    parser.add_argument('--settings-file',
+                        help="Learned settings to load; written after training if it does not exist")
+    parser.add_argument('--training-file',
+                        help="JSON file of labelled pairs ({'0': record, '1': record, 'answer': 'y'|'n'})")
+    parser.add_argument('--pairs-output',
+                        help="Where to write unlabelled pairs when no settings or labels are given")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Similarity threshold (default: 0.5)")
+    parser.add_argument('--selected-columns', nargs='+', help="Columns used to organize training pairs")
+    parser.add_argument('--blocking-columns', nargs='+', help="Columns for the cheap training sample blocking key")
+    parser.add_argument('--max-training-rows', type=int, default=400, help="Training sample size (default: 400)")
+    parser.add_argument('--cores', type=int, help="Processes used for scoring (default: all cores)")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="Rows read per chunk (default: 100000)")
+    parser.add_argument('--out-of-core', action='store_true', help="Keep records in an on-disk store")
+    parser.add_argument('--store-dir', help="Directory for the out-of-core store (default: a temp dir)")
+    parser.add_argument('--max-block-size', type=int, help="Skip blocks larger than this in out-of-core mode")
+    parser.add_argument('--memory-limit-mb', type=int,
+                        help="Abort when resident memory grows by more than this; also sizes the out-of-core store")
+    parser.add_argument('--max-seconds', type=float, help="Abort when the run exceeds this wall-clock time")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log progress at INFO level")
+    return parser
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    output_format = args.format or OUTPUT_FORMATS.get(os.path.splitext(args.output)[1].lower())
+    if output_format is None:
+        print(f"Cannot infer output format from {args.output}; pass --format", file=sys.stderr)
+        return 1
+
+    if output_format == 'parquet':
+        # Fail before a long run rather than after it
+        try:
+            import_pyarrow()
+        except RuntimeError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+
+    file_paths = expand_inputs(args.inputs)
+    training_data = load_training_labels(args.training_file) if args.training_file else None
+
+    config = {
+        'similarity_threshold': args.threshold,
+        'chunk_size': args.chunk_size,
+        'max_training_rows': args.max_training_rows,
+        'selected_columns': args.selected_columns,
+        'blocking_columns': args.blocking_columns,
+        'num_cores': args.cores,
+        'out_of_core': args.out_of_core,
+        'store_dir': args.store_dir,
+        'max_block_size': args.max_block_size
+    }
+    if args.memory_limit_mb:
+        config['memory_limit_mb'] = args.memory_limit_mb
+
+    # Imported here so --help stays fast
+    from worker_pool import JobBudgetExceeded, run_dedupe_job
+    try:
+        result = run_dedupe_job(
+            max_rss_mb=args.memory_limit_mb,
+            max_seconds=args.max_seconds,
+            training_data=training_data,
+            file_paths=file_paths,
+            settings_file=args.settings_file,
+            config=config
+        )
+    except JobBudgetExceeded as e:
+        print(str(e), file=sys.stderr)
+        sys.stderr.flush()
+        # Threads of the aborted run may stay blocked and would hang a normal
+        # interpreter exit
+        os._exit(3)
+
+    if isinstance(result, dict) and 'pairs' in result:
+        pairs_output = args.pairs_output or f"{os.path.splitext(args.output)[0]}.pairs.json"
+        with open(pairs_output, 'w') as f:
+            json.dump(result['pairs'], f, indent=2)
+        print(
+            f"No learned settings or labels given. Wrote {len(result['pairs'])} pairs to {pairs_output}; "
+            f"add an 'answer' of 'y' or 'n' to each and pass it with --training-file.",
+            file=sys.stderr
+        )
+        return 2
+
+    rows = write_results(result, args.output, output_format)
+    print(f"Found {len(result)} duplicate groups; wrote {rows} records to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
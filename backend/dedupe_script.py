@@ -10,17 +10,35 @@ import os
 import json
 import logging
 from typing import Dict, List, Any
+from normalization_cache import normalization_cache
+from training_sample import hash_files, select_training_sample
+from training_session import (
+    TrainingSession,
+    is_valid_session_id,
+    new_session_id,
+    pair_key,
+    snapshot_deduper,
+    training_sessions,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def preprocess(column):
-    """Clean data using Unidecode and Regex"""
+    """Clean data using Unidecode and Regex, memoized per raw value"""
     if not column:
         return "N/A"
-    
-    column = unidecode(str(column))
+    # pandas reads integer columns with gaps as float, and infers dtypes per
+    # chunk; keep 210019.0 and 210019 the same value wherever the cell lands
+    if isinstance(column, float) and column.is_integer():
+        column = int(column)
+
+    return normalization_cache.get_or_compute(str(column), _normalize_value)
+
+def _normalize_value(column: str) -> str:
+    """Uncached normalization of a single stringified cell"""
+    column = unidecode(column)
     # Replace 'nan' with ''
     if column.lower() == 'nan':
         return "N/A"
@@ -32,13 +50,20 @@ def preprocess(column):
 
 def convert_df_to_dedupe_format(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
     """Convert DataFrame to dictionary format required by dedupe"""
+    columns = [column for column in df.columns if column != 'source_file']  # Skip metadata columns
+
+    # Clean column by column so repeated values hit the normalization cache
+    # without building a Series per row
+    cleaned_columns = [[preprocess(value) for value in df[column].tolist()] for column in columns]
+
     data_d = {}
-    for idx, row in df.iterrows():
-        clean_row = {}
-        for column, value in row.items():
-            if column != 'source_file':  # Skip metadata columns
-                clean_row[column] = preprocess(value)
-        data_d[str(idx)] = clean_row
+    for position, idx in enumerate(df.index):
+        data_d[str(idx)] = {
+            column: cleaned_values[position]
+            for column, cleaned_values in zip(columns, cleaned_columns)
+        }
+
+    logger.info(f"Normalization cache stats: {normalization_cache.stats()}")
     return data_d
 
 def read_excel_file(file_path: str, chunk_size: int) -> pd.DataFrame:
@@ -170,16 +195,285 @@ def detect_fields(file_path: str) -> List[Dict]:
         logger.error(f"Error detecting fields from file {file_path}: {str(e)}")
         raise
 
+def build_variable_definition(fields: List[Dict]) -> List:
+    """Convert field configurations to dedupe variables"""
+    variable_definition = []
+    for field_config in fields:
+        field_type = field_config['type']
+        field_name = field_config['field']
+        has_missing = field_config.get('has_missing', False)
+        
+        if field_type == 'String':
+            variable = dedupe.variables.String(field_name, has_missing=has_missing)
+        elif field_type == 'Text':
+            variable = dedupe.variables.Text(field_name, has_missing=has_missing)
+        elif field_type == 'Price':
+            variable = dedupe.variables.Price(field_name, has_missing=has_missing)
+        elif field_type == 'DateTime':
+            variable = dedupe.variables.DateTime(field_name, has_missing=has_missing)
+        elif field_type == 'Exact':
+            variable = dedupe.variables.Exact(field_name, has_missing=has_missing)
+        else:
+            variable = dedupe.variables.String(field_name, has_missing=has_missing)
+            
+        variable_definition.append(variable)
+    return variable_definition
+
+def find_training_records(training_data: List[Dict], records, max_training_rows: int) -> Dict[str, Dict]:
+    """
+    Collect the records referenced by labelled training pairs, topped up with
+    other records until max_training_rows is reached
+    
+    Args:
+        training_data: Labelled pairs, each containing '0' and '1' records
+        records: Iterable of (record_id, record) tuples to search
+        max_training_rows: Target number of training records
+    
+    Returns:
+        Dictionary of record_id -> record to use for prepare_training
+    """
+    ignored_keys = ['confidence_score', 'source_file', 'record_id']
+    labelled_records = []
+    for pair in training_data:
+        labelled_records.append(pair['0'])
+        labelled_records.append(pair['1'])
+
+    training_records = {}  # Store actual records from training data
+    filler_records = {}
+    for record_id, record in records:
+        if any(
+            all(str(record.get(k)) == str(labelled.get(k)) for k in labelled.keys() if k not in ignored_keys)
+            for labelled in labelled_records
+        ):
+            training_records[record_id] = record
+        elif len(filler_records) < max_training_rows:
+            filler_records[record_id] = record
+    
+    logger.info(f"Found {len(training_records)} records from training pairs")
+    
+    # If we have less than max_training_rows records, add other ones
+    remaining_slots = max_training_rows - len(training_records)
+    if remaining_slots > 0:
+        logger.info(f"Adding {remaining_slots} random records to reach {max_training_rows} training records")
+        for record_id in list(filler_records)[:remaining_slots]:
+            training_records[record_id] = filler_records[record_id]
+    
+    return training_records
+
+def collect_uncertain_pairs(deduper, config: Dict, limit: int = None) -> Dict:
+    """Pull uncertain pairs (all of them unless limit is given) from the active learner and organize them for labelling"""
+    uncertain_pairs = []
+    try:
+        while limit is None or len(uncertain_pairs) < limit:
+            uncertain_pair = deduper.uncertain_pairs()
+            if not uncertain_pair:
+                break
+            uncertain_pairs.append(uncertain_pair[0])
+    except IndexError:
+        pass
+        
+    training_pairs = []
+    for pair in uncertain_pairs:
+        training_pairs.append({
+            '0': pair[0],
+            '1': pair[1]
+        })
+
+    # Get organized pairs using the new matching approach
+    organized_pairs = find_top_matching_pairs(training_pairs, config)
+    
+    return {
+        'pairs': organized_pairs,
+        'status': 'needs_training'
+    }
+
+def format_labelled_pairs(training_data: List[Dict]) -> Dict[str, List]:
+    """Convert labelled pairs from the client to the format mark_pairs expects"""
+    formatted_pairs = {
+        "match": [],
+        "distinct": []
+    }
+    
+    for pair in training_data:
+        record_pair = (pair['0'], pair['1'])
+        if pair['answer'] == 'y':
+            formatted_pairs['match'].append(record_pair)
+        elif pair['answer'] == 'n':
+            formatted_pairs['distinct'].append(record_pair)
+    
+    return formatted_pairs
+
+def train_deduper(deduper, training_data: List[Dict], settings_file: str = None):
+    """Mark the labelled pairs, train, and optionally save the learned settings"""
+    # Convert provided training data to dedupe format
+    formatted_pairs = format_labelled_pairs(training_data)
+    
+    logger.info(f"Training dedupe with {len(formatted_pairs['match'])} match pairs and {len(formatted_pairs['distinct'])} distinct pairs")
+    # Train with provided data
+    deduper.mark_pairs(formatted_pairs)
+    deduper.train()
+    
+    if settings_file:
+        with open(settings_file, 'wb') as f:
+            deduper.write_settings(f)
+        logger.info(f"Learned settings saved to {settings_file}")
+
+def load_learned_settings(settings_file: str, config: Dict):
+    """Return a StaticDedupe from previously learned settings, or None if there are none"""
+    if not settings_file or not os.path.exists(settings_file):
+        return None
+    logger.info(f"Loading learned settings from {settings_file}")
+    with open(settings_file, 'rb') as f:
+        return dedupe.StaticDedupe(f, num_cores=config['num_cores'])
+
+def load_trained_deduper(settings_file: str, training_data: List[Dict], config: Dict):
+    """
+    Return a deduper that is ready to cluster without prepare_training
+    
+    Uses learned settings if they exist, otherwise resumes the cached training
+    session and trains it with the labels it has not seen yet. Returns None
+    when neither is available.
+    """
+    deduper = load_learned_settings(settings_file, config)
+    if deduper is not None or training_data is None or not config.get('session_id'):
+        return deduper
+    
+    session = training_sessions.get(config['session_id'])
+    if session is None:
+        return None
+    logger.info(f"Resuming training session {config['session_id']}")
+    new_labels = session.unmarked(training_data)
+    deduper = session.load_deduper(new_labels)
+    train_deduper(deduper, new_labels, settings_file)
+    return deduper
+
+def input_files_hash(file_paths: List[str], config: Dict) -> str:
+    """Hash the input files at most once per job, keeping the result in config"""
+    if not config.get('files_hash'):
+        config['files_hash'] = hash_files(file_paths)
+    return config['files_hash']
+
+def find_training_session(config: Dict):
+    """
+    Return the training session the client sent back, or None
+    
+    Sessions prepared on different input files are ignored. When no session
+    is found, config['session_id'] is cleared so a new one is issued.
+    """
+    session = training_sessions.get(config['session_id']) if config['session_id'] else None
+    if session is not None and session.files_hash != config['files_hash']:
+        logger.warning(f"Training session {config['session_id']} was prepared on different files, starting a new one")
+        session = None
+    if session is None:
+        config['session_id'] = None
+    return session
+
+def start_training_session(deduper, config: Dict) -> Dict:
+    """Cache the freshly prepared deduper under a new session id, then return its uncertain pairs"""
+    if not config['training_sessions']:
+        return collect_uncertain_pairs(deduper, config)
+    
+    # Snapshot before the pairs are drained so later rounds start from a full pool
+    deduper_state = snapshot_deduper(deduper)
+    result = collect_uncertain_pairs(deduper, config)
+    if deduper_state is None:
+        return result
+    session_id = new_session_id()
+    training_sessions.put(session_id, TrainingSession(
+        deduper_state=deduper_state,
+        files_hash=config['files_hash'],
+        initial_pairs=result['pairs']
+    ))
+    return {**result, 'session_id': session_id}
+
+def next_training_batch(deduper, marked: set, training_data: List[Dict], config: Dict) -> Dict:
+    """Mark the new labels and return the next batch of uncertain pairs, keeping the session for the next round"""
+    new_labels = [pair for pair in training_data if pair_key(pair) not in marked]
+    formatted_pairs = format_labelled_pairs(new_labels)
+    logger.info(f"Marking {len(formatted_pairs['match'])} match pairs and {len(formatted_pairs['distinct'])} distinct pairs")
+    deduper.mark_pairs(formatted_pairs)
+    marked = set(marked) | {pair_key(pair) for pair in new_labels}
+    
+    result = collect_uncertain_pairs(deduper, config, limit=config['training_batch_size'])
+    if not config['training_sessions']:
+        return result
+    deduper_state = snapshot_deduper(deduper)
+    if deduper_state is None:
+        return result
+    session_id = config.get('session_id') or new_session_id()
+    training_sessions.put(session_id, TrainingSession(
+        deduper_state=deduper_state,
+        files_hash=config['files_hash'],
+        initial_pairs=result['pairs'],
+        marked=marked
+    ))
+    return {**result, 'session_id': session_id}
+
+def format_cluster(cluster_id: int, members: List[tuple]) -> Dict:
+    """
+    Build a result cluster
+    
+    Args:
+        cluster_id: Sequential id of the cluster
+        members: List of (record_id, record, source_file, score) tuples
+    
+    Returns:
+        Cluster dictionary with full record copies and the mean confidence
+    """
+    cluster_records = []
+    for record_id, record, source_file, score in members:
+        record = record.copy()
+        record.update({
+            'confidence_score': score,
+            'source_file': source_file,
+            'record_id': record_id
+        })
+        cluster_records.append(record)
+    
+    return {
+        'cluster_id': cluster_id,
+        'group_size': len(cluster_records),
+        'confidence_score': sum(r['confidence_score'] for r in cluster_records) / len(cluster_records),
+        'records': cluster_records
+    }
+
+def save_results(output_file: str, results: List[Dict], total_records: int, config: Dict, threshold: float):
+    """Write clustered results to a JSON file"""
+    # Convert numpy float32 values to native Python floats for JSON serialization
+    json_results = []
+    for result in results:
+        result_copy = result.copy()
+        result_copy['confidence_score'] = float(result_copy['confidence_score'])
+        records = []
+        for record in result_copy['records']:
+            record_copy = record.copy()
+            record_copy['confidence_score'] = float(record_copy['confidence_score'])
+            records.append(record_copy)
+        result_copy['records'] = records
+        json_results.append(result_copy)
+
+    with open(output_file, 'w') as f:
+        json.dump({
+            'total_records': total_records,
+            'duplicate_groups_found': len(results),
+            'duplicates': json_results,
+            'configuration': config,
+            'threshold_used': float(threshold)
+        }, f, indent=2)
+    logger.info(f"Results saved to {output_file}")
+
 def find_duplicates_in_files(
     training_data,
     file_paths: List[str], 
     output_file: str = None, 
-    settings_file: str = 'learned_settings',
+    settings_file: str = None,
     config: Dict = None,
 ) -> List[Dict]:
     """
     Find duplicates in one or more CSV or Excel files with configurable parameters
-    Uses only first 400 rows for training but processes entire file for duplicates
+    Trains on a 400 row sample drawn across all files but processes entire file for duplicates
+    If settings_file exists, its learned settings are used instead of training;
+    otherwise the trained settings are written to it
     """
     # Set default configuration
     default_config = {
@@ -190,7 +484,21 @@ def find_duplicates_in_files(
         'required_matches': 1,  # Default to requiring at least one match
         'max_training_matches': 5,  # Number of positive training examples
         'max_training_distincts': 5,  # Number of negative training examples
-        'max_training_rows': 400  # Maximum rows to use for training
+        'max_training_rows': 400,  # Maximum rows to use for training
+        'training_sample_strategy': 'stratified',  # 'stratified' sample across all files, or 'head'
+        'training_pair_fraction': 0.5,  # Share of the training sample drawn from likely duplicate pairs
+        'blocking_columns': None,  # Columns for the cheap sampling key, defaults to selected_columns
+        'out_of_core': False,  # Keep records in an on-disk store instead of memory
+        'memory_limit_mb': 2048,  # Resident memory budget for out-of-core mode
+        'store_dir': None,  # Directory for the out-of-core store, a temp dir if unset
+        'max_block_size': None,  # Skip blocks larger than this in out-of-core mode
+        'num_cores': None,  # Processes dedupe uses for scoring, all cores if unset
+        'training_sessions': True,  # Cache the prepared deduper between labelling rounds
+        'session_id': None,  # Issued with the first batch of pairs; send it back to resume the session
+        'next_batch': False,  # Mark the labels and return the next uncertain batch instead of clustering
+        'training_batch_size': 10,  # Pairs per batch in next_batch mode
+        'explain_scores': False,  # Attach per-field score contributions to each cluster
+        'max_explained_pairs': 50  # Pairs explained per cluster when explain_scores is set
     }
     
     config = {**default_config, **(config or {})}
@@ -205,6 +513,34 @@ def find_duplicates_in_files(
     if not config['fields']:
         config['fields'], config['match_fields'] = detect_fields(file_paths[0])
     
+    if config['session_id'] and not is_valid_session_id(config['session_id']):
+        raise ValueError(f"Invalid session_id {config['session_id']!r}")
+    
+    # Labelling rounds reuse the deduper prepared in the first round when the
+    # client sends back the session id it was issued
+    use_session = (
+        config['training_sessions']
+        and not is_reprocessing
+        and not (settings_file and os.path.exists(settings_file))
+    )
+    config['training_sessions'] = use_session
+    if use_session:
+        input_files_hash(file_paths, config)
+        session = find_training_session(config)
+        if session is not None and training_data is None:
+            logger.info(f"Returning cached pairs for training session {config['session_id']}")
+            return {'pairs': session.initial_pairs, 'status': 'needs_training', 'session_id': config['session_id']}
+        if session is not None and config['next_batch']:
+            logger.info(f"Continuing training session {config['session_id']}")
+            deduper = session.load_deduper(session.unmarked(training_data))
+            return next_training_batch(deduper, session.marked, training_data, config)
+    else:
+        config['session_id'] = None
+    
+    if config['out_of_core']:
+        from out_of_core import find_duplicates_out_of_core
+        return find_duplicates_out_of_core(training_data, file_paths, output_file, settings_file, config)
+    
     # Read all input files
     all_data = read_input_files(file_paths, config['chunk_size'])
     
@@ -214,209 +550,103 @@ def find_duplicates_in_files(
     
     # Convert full data to dedupe format
     full_data_d = convert_df_to_dedupe_format(all_data)
+    normalization_cache.save()
+    
+    deduper = load_trained_deduper(settings_file, training_data, config)
+    if deduper is None:
+        # Handle training data selection based on reprocessing flag
+        if is_reprocessing and training_data:
+            logger.info("Reprocessing mode: Using records from training data")
+            training_data_d = find_training_records(training_data, full_data_d.items(), config['max_training_rows'])
+            logger.info(f"Using {len(training_data_d)} records for training")
+        elif config['training_sample_strategy'] == 'head':
+            # Use first max_training_rows as before
+            training_data_df = all_data.head(config['max_training_rows'])
+            training_data_d = convert_df_to_dedupe_format(training_data_df)
+        else:
+            records = (
+                (record_id, record, source_file)
+                for (record_id, record), source_file in zip(full_data_d.items(), all_data['source_file'].tolist())
+            )
+            training_record_ids = select_training_sample(
+                input_files_hash(file_paths, config), records, config, len(full_data_d)
+            )
+            training_data_d = {
+                record_id: full_data_d[record_id]
+                for record_id in training_record_ids
+                if record_id in full_data_d
+            }
+    
+        # Print data summary
+        logger.info("Data Summary:")
+        logger.info(f"Total records: {len(all_data)}")
+        logger.info(f"Records used for training: {len(training_data_d)}")
+        for file_path in file_paths:
+            file_data = all_data[all_data['source_file'] == os.path.basename(file_path)]
+            logger.info(f"- {file_path}: {len(file_data)} records")
+    
+        variable_definition = build_variable_definition(config['fields'])
+
+        # Initialize deduper
+        logger.info("Training dedupe...")
+        deduper = dedupe.Dedupe(variable_definition, num_cores=config['num_cores'])
     
-    # Handle training data selection based on reprocessing flag
-    if is_reprocessing and training_data:
-        logger.info("Reprocessing mode: Using records from training data")
-        training_record_ids = set()
-        training_records = {}  # Store actual records from training data
-        
-        # First, collect all records from training data
-        for pair in training_data:
-            record1 = pair['0']
-            record2 = pair['1']
-            
-            # Find and store matching records from full_data_d
-            for record_id, record in full_data_d.items():
-                if all(str(record.get(k)) == str(record1.get(k)) for k in record1.keys() if k not in ['confidence_score', 'source_file', 'record_id']):
-                    training_record_ids.add(record_id)
-                    training_records[record_id] = record
-                if all(str(record.get(k)) == str(record2.get(k)) for k in record2.keys() if k not in ['confidence_score', 'source_file', 'record_id']):
-                    training_record_ids.add(record_id)
-                    training_records[record_id] = record
+        # Use training data subset for prepare_training
+        deduper.prepare_training(training_data_d)
         
-        logger.info(f"Found {len(training_record_ids)} records from training pairs")
+        if training_data is None:
+            return start_training_session(deduper, config)
+        if config['next_batch']:
+            return next_training_batch(deduper, set(), training_data, config)
+        train_deduper(deduper, training_data, settings_file)
+    
+    # Now use the trained model on the full dataset
+    logger.info("Finding duplicates in full dataset...")
+    threshold = config['similarity_threshold']
+    logger.info(f"Using threshold: {threshold}")
+    
+    # Process in chunks of 10000
+    chunk_size = 1000
+    results = []
+    total_clusters = 0
+    record_ids = list(full_data_d.keys())
+    
+    # Process data in chunks
+    for i in range(0, len(all_data), chunk_size):
+        chunk_end = min(i + chunk_size, len(all_data))
+        logger.info(f"Processing records {i} to {chunk_end} of {len(all_data)}")
         
-        # If we have less than max_training_rows records, add random ones
-        remaining_slots = config['max_training_rows'] - len(training_record_ids)
-        if remaining_slots > 0:
-            logger.info(f"Adding {remaining_slots} random records to reach {config['max_training_rows']} training records")
-            available_ids = set(full_data_d.keys()) - training_record_ids
-            additional_ids = set(list(available_ids)[:remaining_slots])
-            for record_id in additional_ids:
-                training_records[record_id] = full_data_d[record_id]
-            training_record_ids.update(additional_ids)
+        # Get chunk of data
+        chunk_keys = record_ids[i:chunk_end]
+        chunk_data = {k: full_data_d[k] for k in chunk_keys}
         
-        # Create training data dictionary using stored records
-        training_data_d = training_records
-        logger.info(f"Using {len(training_data_d)} records for training")
-    else:
-        # Use first max_training_rows as before
-        training_data_df = all_data.head(config['max_training_rows'])
-        training_data_d = convert_df_to_dedupe_format(training_data_df)
-    
-    # Print data summary
-    logger.info("Data Summary:")
-    logger.info(f"Total records: {len(all_data)}")
-    logger.info(f"Records used for training: {len(training_data_d)}")
-    for file_path in file_paths:
-        file_data = all_data[all_data['source_file'] == os.path.basename(file_path)]
-        logger.info(f"- {file_path}: {len(file_data)} records")
-    
-    # Convert field configurations to dedupe format
-    variable_definition = []
-    for field_config in config['fields']:
-        field_type = field_config['type']
-        field_name = field_config['field']
-        has_missing = field_config.get('has_missing', False)
+        # Find duplicates in this chunk
+        chunk_dupes = deduper.partition(chunk_data, threshold)
         
-        if field_type == 'String':
-            variable = dedupe.variables.String(field_name, has_missing=has_missing)
-        elif field_type == 'Text':
-            variable = dedupe.variables.Text(field_name, has_missing=has_missing)
-        elif field_type == 'Price':
-            variable = dedupe.variables.Price(field_name, has_missing=has_missing)
-        elif field_type == 'DateTime':
-            variable = dedupe.variables.DateTime(field_name, has_missing=has_missing)
-        elif field_type == 'Exact':
-            variable = dedupe.variables.Exact(field_name, has_missing=has_missing)
-        else:
-            variable = dedupe.variables.String(field_name, has_missing=has_missing)
-            
-        variable_definition.append(variable)
+        # Process results from this chunk
+        for records, scores in chunk_dupes:
+            if len(records) > 1:  # Only include actual duplicates
+                members = [
+                    (record_id, full_data_d[record_id], all_data.loc[int(record_id), 'source_file'], score)
+                    for record_id, score in zip(records, scores)
+                ]
+                
+                # Add all clusters without additional checks
+                results.append(format_cluster(total_clusters, members))
+                total_clusters += 1
 
-    # Initialize deduper
-    logger.info("Training dedupe...")
-    deduper = dedupe.Dedupe(variable_definition)
+    logger.info(f"Found {len(results)} duplicate groups across all chunks")
+    results = sorted(results, key=lambda x: x['confidence_score'], reverse=True)
     
-    # Use training data subset for prepare_training
-    deduper.prepare_training(training_data_d)
+    if config['explain_scores']:
+        from score_explanation import explain_clusters
+        explain_clusters(deduper, results, config['max_explained_pairs'])
     
-    uncertain_pairs = []
-    if training_data is None:
-        try:
-            while True:
-                uncertain_pair = deduper.uncertain_pairs()
-                if not uncertain_pair:
-                    break
-                uncertain_pairs.append(uncertain_pair[0])
-        except IndexError:
-            pass
-            
-        training_pairs = []
-        for pair in uncertain_pairs:
-            training_pairs.append({
-                '0': pair[0],
-                '1': pair[1]
-            })
-
-        # Get organized pairs using the new matching approach
-        organized_pairs = find_top_matching_pairs(training_pairs, config)
-        
-        return {
-            'pairs': organized_pairs,
-            'status': 'needs_training'
-        }
-    else:
-        # Convert provided training data to dedupe format
-        formatted_pairs = {
-            "match": [],
-            "distinct": []
-        }
-        
-        for pair in training_data:
-            record_pair = (pair['0'], pair['1'])
-            if pair['answer'] == 'y':
-                formatted_pairs['match'].append(record_pair)
-            elif pair['answer'] == 'n':
-                formatted_pairs['distinct'].append(record_pair)
-        
-        logger.info(f"Training dedupe with {len(formatted_pairs['match'])} match pairs and {len(formatted_pairs['distinct'])} distinct pairs")
-        # Train with provided data
-        deduper.mark_pairs(formatted_pairs)
-        deduper.train()
-        
-        # Now use the trained model on the full dataset
-        logger.info("Finding duplicates in full dataset...")
-        threshold = config['similarity_threshold']
-        logger.info(f"Using threshold: {threshold}")
-        
-        # Process in chunks of 10000
-        chunk_size = 1000
-        results = []
-        cluster_membership = {}
-        total_clusters = 0
-        
-        # Process data in chunks
-        for i in range(0, len(all_data), chunk_size):
-            chunk_end = min(i + chunk_size, len(all_data))
-            logger.info(f"Processing records {i} to {chunk_end} of {len(all_data)}")
-            
-            # Get chunk of data
-            chunk_keys = list(full_data_d.keys())[i:chunk_end]
-            chunk_data = {k: full_data_d[k] for k in chunk_keys}
-            
-            # Find duplicates in this chunk
-            chunk_dupes = deduper.partition(chunk_data, threshold)
-            
-            # Process results from this chunk
-            for records, scores in chunk_dupes:
-                if len(records) > 1:  # Only include actual duplicates
-                    cluster_records = []
-                    
-                    # Save cluster membership for each record
-                    for record_id, score in zip(records, scores):
-                        cluster_membership[record_id] = {
-                            "cluster_id": total_clusters,
-                            "confidence_score": score
-                        }
-                        
-                        record = full_data_d[record_id].copy()
-                        record.update({
-                            'confidence_score': score,
-                            'source_file': all_data.loc[int(record_id), 'source_file'],
-                            'record_id': record_id
-                        })
-                        cluster_records.append(record)
-                    
-                    # Add all clusters without additional checks
-                    results.append({
-                        'cluster_id': total_clusters,
-                        'group_size': len(cluster_records),
-                        'confidence_score': sum(r['confidence_score'] for r in cluster_records) / len(cluster_records),
-                        'records': cluster_records
-                    })
-                    total_clusters += 1
-
-        logger.info(f"Found {len(results)} duplicate groups across all chunks")
-        results = sorted(results, key=lambda x: x['confidence_score'], reverse=True)
-        
-        # Save results if output file is specified
-        if output_file:
-            # Convert numpy float32 values to native Python floats for JSON serialization
-            json_results = []
-            for result in results:
-                result_copy = result.copy()
-                result_copy['confidence_score'] = float(result_copy['confidence_score'])
-                records = []
-                for record in result_copy['records']:
-                    record_copy = record.copy()
-                    record_copy['confidence_score'] = float(record_copy['confidence_score'])
-                    records.append(record_copy)
-                result_copy['records'] = records
-                json_results.append(result_copy)
-
-            with open(output_file, 'w') as f:
-                json.dump({
-                    'total_records': len(all_data),
-                    'duplicate_groups_found': len(results),
-                    'duplicates': json_results,
-                    'configuration': config,
-                    'threshold_used': float(threshold)
-                }, f, indent=2)
-            logger.info(f"Results saved to {output_file}")
-        
-        return results
+    # Save results if output file is specified
+    if output_file:
+        save_results(output_file, results, len(all_data), config, threshold)
+    
+    return results
 
 def find_top_matching_pairs(training_pairs: List[Dict], config: Dict) -> List[Dict]:
     """
@@ -434,7 +664,7 @@ def find_top_matching_pairs(training_pairs: List[Dict], config: Dict) -> List[Di
         
     # Get columns to match from config, fallback to first two if not specified
     sample_record = training_pairs[0]['0']
-    match_columns = config.get('selected_columns', list(sample_record.keys())[:2])
+    match_columns = config.get('selected_columns') or list(sample_record.keys())[:2]
     
     # Categorize pairs based on selected columns
     matching_pairs = []
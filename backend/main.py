@@ -1,19 +1,25 @@
 from asyncio.log import logger
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
+import asyncio
 import os
 from typing import List
 import tempfile
-from dedupe_script import find_duplicates_in_files
-import numpy as np
 import json
 from contextlib import asynccontextmanager
-from test_response import test_response
+from worker_pool import WorkerPool, run_dedupe_job, JobMemoryExceeded, JobTimeExceeded, WorkerCrashed
+from admission import AdmissionController, AdmissionRejected, AdmittedJob, estimate_job_cost
+from result_encoding import ResultStore, encode_compact
+from training_session import is_valid_session_id
+
+# Heavy modules (dedupe, pandas, unidecode) are only imported inside the
+# worker processes so the API can answer health checks right after start
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
+        import numpy as np
         if isinstance(obj, np.floating):
             return float(obj)
         if isinstance(obj, np.integer):
@@ -24,8 +30,10 @@ class NumpyEncoder(json.JSONEncoder):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    worker_pool.start()
     yield
     # Cleanup on shutdown
+    worker_pool.shutdown()
     if os.path.exists(TEMP_DIR):
         shutil.rmtree(TEMP_DIR)
 
@@ -49,15 +57,56 @@ app.add_middleware(
 # Create a temporary directory to store uploaded files
 TEMP_DIR = tempfile.mkdtemp()
 
+worker_pool = WorkerPool()
+
+# Full results kept for clients that requested a compact payload without fields
+result_store = ResultStore()
+
+RESULT_FORMATS = ('json', 'msgpack')
+
+# Gate jobs on estimated memory and free workers instead of letting every
+# upload load its data at once
+admission = AdmissionController(
+    max_running=worker_pool.size,
+    memory_budget_mb=int(os.environ.get('ADMISSION_MEMORY_BUDGET_MB', 0)) or None,
+    max_queued=int(os.environ.get('MAX_QUEUED_JOBS', 20)),
+    queue_timeout=float(os.environ.get('QUEUE_TIMEOUT_SECONDS', 300))
+)
+
+# Per-job budgets enforced inside the workers
+JOB_MAX_SECONDS = float(os.environ.get('JOB_MAX_SECONDS', 7200))
+JOB_RSS_HEADROOM = 2  # Allowed RSS as a multiple of the job's estimate
+MIN_JOB_RSS_MB = 1024
+
+def _job_rss_budget(estimated_mb: int) -> int:
+    budget = max(estimated_mb * JOB_RSS_HEADROOM, MIN_JOB_RSS_MB)
+    return min(budget, int(os.environ.get('JOB_MAX_RSS_MB', 0)) or admission.memory_budget_mb)
+
 @app.post("/dedupe", response_class=JSONResponse)
 async def dedupe_files(
     files: List[UploadFile] = File(...),
     similarity_threshold: float = Form(0.6),
     training_data: str = Form(None),
     selected_columns: str = Form(None),
-    is_reprocessing: bool = Form(False)
+    is_reprocessing: bool = Form(False),
+    out_of_core: bool = Form(False),
+    result_format: str = Form('json'),
+    include_fields: bool = Form(True),
+    session_id: str = Form(None),
+    next_batch: bool = Form(False),
+    explain_scores: bool = Form(False)
     ):
     print(f"Received is_reprocessing: {is_reprocessing}, training_data: {training_data}, selected_columns: {selected_columns}")
+    if result_format not in RESULT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid result_format {result_format}. Supported formats: {', '.join(RESULT_FORMATS)}."
+        )
+    if session_id and not is_valid_session_id(session_id):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid session_id. Send back the session_id returned with the training pairs."
+        )
     # response_obj = {
     #             "status": "success",
     #             "duplicates": test_response
@@ -65,7 +114,9 @@ async def dedupe_files(
     # return JSONResponse(
     #         content=json.loads(json.dumps(response_obj, cls=NumpyEncoder))
     #     )
-   
+
+    temp_files = []
+    upload_dir = None
     try:
         if selected_columns:
             print(f"Received selected columns: {selected_columns[:100]}...")  # Print first 100 chars for debugging
@@ -90,10 +141,11 @@ async def dedupe_files(
                     detail=f"Invalid file type for {file.filename}. Only CSV and Excel files are supported."
                 )
 
-        # Save uploaded files temporarily
-        temp_files = []
+        # Save uploaded files temporarily, in a directory of their own so
+        # concurrent jobs uploading the same filename never share a path
+        upload_dir = tempfile.mkdtemp(dir=TEMP_DIR)
         for file in files:
-            temp_path = os.path.join(TEMP_DIR, file.filename)
+            temp_path = os.path.join(upload_dir, os.path.basename(file.filename))
             with open(temp_path, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
             temp_files.append(temp_path)
@@ -108,59 +160,132 @@ async def dedupe_files(
             'max_training_pairs': 100,
             'recall_weight': 1.0,
             'fields': [],
-            'selected_columns': selected_columns if selected_columns is not None and len(selected_columns) > 0 else None
+            'selected_columns': selected_columns if selected_columns is not None and len(selected_columns) > 0 else None,
+            'out_of_core': out_of_core,
+            'session_id': session_id,
+            'next_batch': next_batch,
+            'explain_scores': explain_scores
         }
 
-        # Run deduplication
-        result = find_duplicates_in_files(
-            file_paths=temp_files,
-            config={
-                **config,
-                'is_reprocessing': is_reprocessing
-            },
-            training_data=training_data
-        )
+        cost = await asyncio.to_thread(estimate_job_cost, temp_files, out_of_core)
+        logger.info(f"Estimated job cost: {cost.rows} rows, {cost.memory_mb} MB; admission state: {admission.stats()}")
+
+        async with AdmittedJob(admission, cost):
+            # Run deduplication in a warm worker so the event loop stays free
+            result = await worker_pool.run(
+                run_dedupe_job,
+                max_rss_mb=_job_rss_budget(cost.memory_mb),
+                max_seconds=JOB_MAX_SECONDS,
+                file_paths=temp_files,
+                config={
+                    **config,
+                    'is_reprocessing': is_reprocessing
+                },
+                training_data=training_data
+            )
 
 
+        # Clean up temporary files
+        _remove_upload_dir(upload_dir)
+
         if "pairs" in result:
             response_obj = {
                 "status": "needs_training",
-                "pairs": result["pairs"]
+                "pairs": result["pairs"],
+                "session_id": result.get("session_id")
             }
+        elif result_format == 'msgpack':
+            result_id = None if include_fields else result_store.put(result)
+            print(f"Returning {len(result)} duplicate groups as msgpack")
+            return Response(
+                content=encode_compact(result, include_fields=include_fields, result_id=result_id),
+                media_type="application/x-msgpack"
+            )
         else:
             response_obj = {
                 "status": "success",
                 "duplicates": result
             }
 
-        print(f"Response object: {response_obj}")
+        print(f"Returning response with status {response_obj['status']}")
 
-        # Clean up temporary files
-        for temp_file in temp_files:
-            os.remove(temp_file)
-
-        # Format response
-        return JSONResponse(
-            content=json.loads(json.dumps(response_obj, cls=NumpyEncoder))
+        # Format response; serialize once instead of dumping, loading and
+        # dumping again
+        return Response(
+            content=json.dumps(response_obj, cls=NumpyEncoder),
+            media_type="application/json"
         )
 
+    except AdmissionRejected as e:
+        _remove_upload_dir(upload_dir)
+        raise HTTPException(
+            status_code=429,
+            detail=f"{str(e)}. Retry in about {e.retry_after} seconds.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except HTTPException:
+        _remove_upload_dir(upload_dir)
+        raise
+    except JobMemoryExceeded as e:
+        _remove_upload_dir(upload_dir)
+        raise HTTPException(
+            status_code=413,
+            detail=f"{str(e)}. Retry with out_of_core enabled for large files."
+        )
+    except JobTimeExceeded as e:
+        _remove_upload_dir(upload_dir)
+        raise HTTPException(
+            status_code=504,
+            detail=str(e)
+        )
+    except WorkerCrashed as e:
+        _remove_upload_dir(upload_dir)
+        raise HTTPException(
+            status_code=503,
+            detail=f"{str(e)}. Retry with out_of_core enabled for large files."
+        )
     except Exception as e:
         import traceback
         traceback.print_exc()
         # Clean up temporary files in case of error
-        for temp_file in temp_files:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+        _remove_upload_dir(upload_dir)
         
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
 
+def _remove_upload_dir(upload_dir: str):
+    if upload_dir and os.path.exists(upload_dir):
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+@app.get("/results/{result_id}/records")
+async def get_result_records(result_id: str, ids: str):
+    """Fetch full records for a compact result returned without fields"""
+    records = result_store.get_records(result_id, [record_id for record_id in ids.split(',') if record_id])
+    if records is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Result {result_id} not found or expired."
+        )
+    return Response(
+        content=json.dumps({"records": records}, cls=NumpyEncoder),
+        media_type="application/json"
+    )
+
 @app.get("/")
 async def root():
     return {"message": "API is running"}
 
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "workers_ready": worker_pool.ready,
+        "workers": worker_pool.size,
+        "admission": admission.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -169,6 +294,6 @@ if __name__ == "__main__":
         port=8000,
         reload=True,
         timeout_keep_alive=7200,  # 2 hours in seconds
-        limit_concurrency=10,
+        limit_concurrency=64,
         backlog=128
     )
\ No newline at end of file
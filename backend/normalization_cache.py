@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def _file_lock(path: str):
+    """Hold an exclusive lock on path across processes, where the platform supports it"""
+    with open(path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class NormalizationCache:
+    """
+    Process-wide, size-bounded LRU cache of normalized cell values
+
+    Uploads repeat a small set of values (countries, cities, placeholders like
+    "nan"), so caching the output of `preprocess` per raw value skips most of
+    the unidecode and regex work. The cache is guarded by a lock so it can be
+    shared by threads, and each worker process holds its own copy.
+    """
+
+    def __init__(self, max_size: int = 200000, persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self._data: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if persist_path:
+            self.load()
+
+    def get_or_compute(self, key: str, compute: Callable[[str], str]) -> str:
+        """Return the cached value for key, computing and storing it on a miss"""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Compute outside the lock; a concurrent miss on the same key just
+        # computes the same value twice
+        value = compute(key)
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> Dict:
+        """Return hit-rate metrics for logging and monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def _read_persisted(self) -> Dict[str, str]:
+        """Return the entries in the persisted file, or {} if it is missing or corrupt"""
+        if not os.path.exists(self.persist_path):
+            return {}
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load normalization cache from {self.persist_path}: {str(e)}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def load(self):
+        """Load previously persisted entries, ignoring a missing or corrupt file"""
+        if not self.persist_path:
+            return
+        entries = self._read_persisted()
+        with self._lock:
+            # Keep only the most recent entries if the file outgrew max_size
+            for key, value in list(entries.items())[-self.max_size:]:
+                self._data[key] = value
+        logger.info(f"Loaded {len(self._data)} normalization cache entries from {self.persist_path}")
+
+    def save(self):
+        """
+        Merge the cache into the persisted file and replace it atomically
+
+        Every worker saves after its jobs, so entries already on disk (from
+        other workers or earlier runs) are kept, with this process's entries
+        counted as the most recent. A lock file serializes the read-merge-write
+        across processes, and concurrent readers never see a partial file.
+        """
+        if not self.persist_path:
+            return
+        with self._lock:
+            entries = list(self._data.items())
+
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        os.makedirs(directory, exist_ok=True)
+        with _file_lock(f"{self.persist_path}.lock"):
+            merged = OrderedDict(self._read_persisted())
+            for key, value in entries:
+                merged.pop(key, None)
+                merged[key] = value
+            while len(merged) > self.max_size:
+                merged.popitem(last=False)
+
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(merged, f)
+                os.replace(temp_path, self.persist_path)
+            except OSError as e:
+                logger.warning(f"Could not save normalization cache to {self.persist_path}: {str(e)}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+# Shared by every job running in this process
+normalization_cache = NormalizationCache(
+    max_size=int(os.environ.get('NORMALIZATION_CACHE_SIZE', 200000)),
+    persist_path=os.environ.get('NORMALIZATION_CACHE_PATH') or None
+)
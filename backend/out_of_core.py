@@ -0,0 +1,383 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import dedupe
+
+from dedupe_script import (
+    build_variable_definition,
+    convert_df_to_dedupe_format,
+    find_training_records,
+    format_cluster,
+    input_files_hash,
+    load_trained_deduper,
+    next_training_batch,
+    save_results,
+    start_training_session,
+    train_deduper,
+)
+from normalization_cache import normalization_cache
+from training_sample import select_training_sample
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip when streaming records or pairs out of SQLite
+FETCH_BATCH_SIZE = 10000
+
+class RecordStore:
+    """
+    SQLite-backed columnar store of preprocessed records and their blocking keys
+
+    Every field lives in its own column (c0, c1, ...) so distinct values can be
+    scanned per field without decoding whole records. Record ids are the
+    global row positions across all input files, matching the ids used by the
+    in-memory path.
+    """
+
+    def __init__(self, path: str, fields: List[str], memory_limit_mb: int = 2048):
+        self.path = path
+        self.fields = fields
+        self._columns = [f"c{i}" for i in range(len(fields))]
+        self.conn = sqlite3.connect(path)
+
+        # Give SQLite a quarter of the memory budget for its page cache and
+        # make sorts and DISTINCTs spill to disk instead of RAM
+        cache_kib = max(memory_limit_mb * 1024 // 4, 2048)
+        self.conn.execute(f"PRAGMA cache_size = -{cache_kib}")
+        self.conn.execute("PRAGMA temp_store = FILE")
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+        column_defs = ", ".join(f"{column} TEXT" for column in self._columns)
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS records "
+            f"(record_id INTEGER PRIMARY KEY, source_file TEXT, {column_defs})"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS blocking_map (block_key TEXT, record_id INTEGER)")
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def _to_record(self, row: tuple) -> Dict[str, str]:
+        return dict(zip(self.fields, row))
+
+    def insert_chunk(self, chunk: pd.DataFrame):
+        """Preprocess a DataFrame chunk whose index holds global record ids and append it"""
+        data_d = convert_df_to_dedupe_format(chunk)
+        source_files = chunk['source_file'].tolist()
+        placeholders = ", ".join("?" * (len(self._columns) + 2))
+        self.conn.executemany(
+            f"INSERT INTO records VALUES ({placeholders})",
+            (
+                (int(record_id), source_file, *[record.get(field, "N/A") for field in self.fields])
+                for (record_id, record), source_file in zip(data_d.items(), source_files)
+            )
+        )
+        self.conn.commit()
+
+    def load_files(self, file_paths: List[str], chunk_size: int):
+        """Stream every input file into the store one chunk at a time"""
+        offset = 0
+        for file_path in file_paths:
+            logger.info(f"Loading {file_path} into out-of-core store")
+            for chunk in iter_file_chunks(file_path, chunk_size):
+                chunk.index = range(offset, offset + len(chunk))
+                chunk['source_file'] = os.path.basename(file_path)
+                self.insert_chunk(chunk)
+                offset += len(chunk)
+                logger.info(f"Stored {offset} records")
+        normalization_cache.save()
+
+    def iter_records(self) -> Iterator[Tuple[str, Dict[str, str]]]:
+        """Yield (record_id, record) tuples in record id order"""
+        cursor = self.conn.execute(f"SELECT record_id, {', '.join(self._columns)} FROM records ORDER BY record_id")
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield str(row[0]), self._to_record(row[1:])
+
+    def iter_records_with_source(self) -> Iterator[Tuple[str, Dict[str, str], str]]:
+        """Yield (record_id, record, source_file) tuples in record id order"""
+        cursor = self.conn.execute(
+            f"SELECT record_id, source_file, {', '.join(self._columns)} FROM records ORDER BY record_id"
+        )
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield str(row[0]), self._to_record(row[2:]), row[1]
+
+    def head(self, n: int) -> Dict[str, Dict[str, str]]:
+        rows = self.conn.execute(
+            f"SELECT record_id, {', '.join(self._columns)} FROM records ORDER BY record_id LIMIT ?", (n,)
+        ).fetchall()
+        return {str(row[0]): self._to_record(row[1:]) for row in rows}
+
+    def get_records(self, record_ids: Iterable[str]) -> Dict[str, Tuple[Dict[str, str], str]]:
+        """Return record_id -> (record, source_file) for the requested ids"""
+        record_ids = [int(record_id) for record_id in record_ids]
+        found = {}
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(record_ids), 500):
+            batch = record_ids[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT record_id, source_file, {', '.join(self._columns)} FROM records "
+                f"WHERE record_id IN ({', '.join('?' * len(batch))})",
+                batch
+            ).fetchall()
+            for row in rows:
+                found[str(row[0])] = (self._to_record(row[2:]), row[1])
+        return found
+
+    def field_values(self, field: str) -> Iterator[str]:
+        """Yield the distinct values of one field"""
+        column = self._columns[self.fields.index(field)]
+        cursor = self.conn.execute(f"SELECT DISTINCT {column} FROM records")
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+
+    def write_blocking_map(self, blocks: Iterable[Tuple[str, str]]):
+        """Persist (block_key, record_id) tuples and index them by block key"""
+        self.conn.execute("DELETE FROM blocking_map")
+        batch = []
+        for block_key, record_id in blocks:
+            batch.append((block_key, int(record_id)))
+            if len(batch) >= FETCH_BATCH_SIZE:
+                self.conn.executemany("INSERT INTO blocking_map VALUES (?, ?)", batch)
+                batch = []
+        if batch:
+            self.conn.executemany("INSERT INTO blocking_map VALUES (?, ?)", batch)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS blocking_map_key ON blocking_map (block_key, record_id)")
+        self.conn.commit()
+
+    def candidate_pairs(self, max_block_size: Optional[int] = None) -> Iterator[tuple]:
+        """
+        Stream distinct candidate pairs that share at least one block
+
+        The pair join and de-duplication run inside SQLite, which spills to
+        disk, so only one fetch batch of pairs is resident at a time.
+        """
+        block_filter = ""
+        params: tuple = ()
+        if max_block_size:
+            block_filter = (
+                "WHERE block_key NOT IN (SELECT block_key FROM blocking_map "
+                "GROUP BY block_key HAVING COUNT(*) > ?)"
+            )
+            params = (max_block_size,)
+
+        columns_a = ", ".join(f"a.{column}" for column in self._columns)
+        columns_b = ", ".join(f"b.{column}" for column in self._columns)
+        cursor = self.conn.execute(
+            f"""
+            SELECT a.record_id, {columns_a}, b.record_id, {columns_b}
+            FROM (
+                SELECT DISTINCT l.record_id AS east, r.record_id AS west
+                FROM (SELECT * FROM blocking_map {block_filter}) l
+                INNER JOIN blocking_map r
+                    ON l.block_key = r.block_key AND l.record_id < r.record_id
+            ) ids
+            INNER JOIN records a ON ids.east = a.record_id
+            INNER JOIN records b ON ids.west = b.record_id
+            ORDER BY ids.east, ids.west
+            """,
+            params
+        )
+        width = len(self._columns) + 1
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield (
+                    (str(row[0]), self._to_record(row[1:width])),
+                    (str(row[width]), self._to_record(row[width + 1:]))
+                )
+
+    def close(self):
+        self.conn.close()
+
+def normalize_headers(headers: Iterable) -> List:
+    """
+    Name header cells the way pd.read_excel does
+
+    Empty headers become 'Unnamed: <position>' and repeated names get a
+    '.1', '.2', ... suffix, so streamed chunks have the same columns as the
+    fields detected with pandas.
+    """
+    names = [f"Unnamed: {position}" if header is None else header for position, header in enumerate(headers)]
+    counts: Dict = {}
+    for position, name in enumerate(names):
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        names[position] = name
+        counts[name] = count + 1
+    return names
+
+def _without_trailing_blank_rows(rows: Iterable[tuple]) -> Iterator[tuple]:
+    """
+    Yield sheet rows, dropping the blank rows after the last non-blank one
+
+    openpyxl's read-only mode yields every row up to max_row. pd.read_excel
+    trims the trailing blank rows but keeps interior ones, and so does this,
+    so record ids match the in-memory path.
+    """
+    blank_row = None
+    blank_count = 0
+    for row in rows:
+        if all(value is None for value in row):
+            blank_row = row
+            blank_count += 1
+            continue
+        for _ in range(blank_count):
+            yield blank_row
+        blank_count = 0
+        yield row
+
+def iter_file_chunks(file_path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Yield DataFrame chunks of a CSV or Excel file without loading it whole
+
+    Args:
+        file_path: Path to the CSV or Excel file
+        chunk_size: Number of rows per chunk
+
+    Returns:
+        Iterator of DataFrame chunks with the file's header as columns
+    """
+    if file_path.endswith('.xlsx'):
+        # openpyxl's read-only mode streams rows instead of building the sheet
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = next(rows, None)
+            if headers is None:
+                return
+            headers = normalize_headers(headers)
+            batch = []
+            for row in _without_trailing_blank_rows(rows):
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    yield pd.DataFrame(batch, columns=headers)
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=headers)
+        finally:
+            workbook.close()
+    elif file_path.endswith('.xls'):
+        # Legacy .xls has no streaming reader; fall back to a full read
+        yield pd.read_excel(file_path)
+    else:
+        yield from pd.read_csv(file_path, chunksize=chunk_size, encoding='utf-8')
+
+def find_duplicates_out_of_core(
+    training_data,
+    file_paths: List[str],
+    output_file: Optional[str],
+    settings_file: Optional[str],
+    config: Dict
+):
+    """
+    Out-of-core variant of find_duplicates_in_files
+
+    Records are kept in a SQLite store on disk, blocking keys are written to an
+    on-disk index, and candidate pairs are streamed from a join over that index
+    into dedupe's scorer, so resident memory does not grow with the input size.
+    """
+    fields = [field_config['field'] for field_config in config['fields']]
+    store_dir = config.get('store_dir') or tempfile.mkdtemp(prefix='dedupe_store_')
+    os.makedirs(store_dir, exist_ok=True)
+    store_path = os.path.join(store_dir, 'records.sqlite')
+    if os.path.exists(store_path):
+        os.remove(store_path)
+    store = RecordStore(store_path, fields, config['memory_limit_mb'])
+
+    try:
+        store.load_files(file_paths, config['chunk_size'])
+        total_records = len(store)
+        if total_records == 0:
+            raise ValueError("No data found in input files")
+
+        deduper = load_trained_deduper(settings_file, training_data, config)
+        if deduper is None:
+            if config.get('is_reprocessing', False) and training_data:
+                logger.info("Reprocessing mode: Using records from training data")
+                training_data_d = find_training_records(training_data, store.iter_records(), config['max_training_rows'])
+            elif config['training_sample_strategy'] == 'head':
+                training_data_d = store.head(config['max_training_rows'])
+            else:
+                training_record_ids = select_training_sample(
+                    input_files_hash(file_paths, config), store.iter_records_with_source(), config, total_records
+                )
+                training_data_d = {
+                    record_id: record
+                    for record_id, (record, _) in store.get_records(training_record_ids).items()
+                }
+
+            logger.info(f"Out-of-core store holds {total_records} records, {len(training_data_d)} used for training")
+
+            deduper = dedupe.Dedupe(build_variable_definition(config['fields']), num_cores=config['num_cores'])
+            deduper.prepare_training(training_data_d)
+
+            if training_data is None:
+                return start_training_session(deduper, config)
+            if config['next_batch']:
+                return next_training_batch(deduper, set(), training_data, config)
+
+            train_deduper(deduper, training_data, settings_file)
+            # Release the training sample and active learner before blocking
+            deduper.cleanup_training()
+
+        logger.info("Writing blocking map...")
+        fingerprinter = deduper.fingerprinter
+        for field in fingerprinter.index_fields:
+            fingerprinter.index(store.field_values(field), field)
+        store.write_blocking_map(fingerprinter(store.iter_records()))
+        fingerprinter.reset_indices()
+
+        threshold = config['similarity_threshold']
+        logger.info(f"Scoring candidate pairs with threshold: {threshold}")
+        scores = deduper.score(store.candidate_pairs(config.get('max_block_size')))
+
+        results = []
+        clusters = deduper.cluster(scores, threshold) if len(scores) else []
+        for records, cluster_scores in clusters:
+            if len(records) > 1:  # Only include actual duplicates
+                found = store.get_records(records)
+                members = [
+                    (record_id, found[record_id][0], found[record_id][1], score)
+                    for record_id, score in zip(records, cluster_scores)
+                ]
+                results.append(format_cluster(len(results), members))
+
+        logger.info(f"Found {len(results)} duplicate groups")
+        results = sorted(results, key=lambda x: x['confidence_score'], reverse=True)
+
+        if config['explain_scores']:
+            from score_explanation import explain_clusters
+            explain_clusters(deduper, results, config['max_explained_pairs'])
+
+        if output_file:
+            save_results(output_file, results, total_records, config, threshold)
+
+        return results
+    finally:
+        store.close()
+        if not config.get('store_dir'):
+            shutil.rmtree(store_dir, ignore_errors=True)
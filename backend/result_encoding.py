@@ -0,0 +1,137 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import msgpack
+
+# Keys added to every clustered record on top of the input columns
+META_FIELDS = ['confidence_score', 'source_file', 'record_id']
+
+def _dictionary_encode(values: List) -> Dict:
+    """Replace values with int32 codes into a list of distinct values"""
+    import numpy as np
+    dictionary = {}
+    codes = np.empty(len(values), dtype='<i4')
+    for i, value in enumerate(values):
+        codes[i] = dictionary.setdefault(value, len(dictionary))
+    return {
+        'dictionary': list(dictionary),
+        'codes': codes.tobytes()
+    }
+
+def encode_compact(results: List[Dict], include_fields: bool = True, result_id: Optional[str] = None) -> bytes:
+    """
+    Encode clustered results as columnar MessagePack
+
+    Numeric columns are packed as little-endian typed arrays (int32 record and
+    cluster ids, float32 scores) that clients can view directly as
+    Int32Array/Float32Array. Record fields are dictionary-encoded per column,
+    so repeated values like countries and "N/A" are stored once.
+
+    Args:
+        results: Clusters as returned by find_duplicates_in_files
+        include_fields: Whether to include the record fields; when False the
+            client fetches them via GET /results/{result_id}/records
+        result_id: Id of the stored full results, if any
+
+    Returns:
+        MessagePack-encoded payload
+    """
+    import numpy as np
+
+    columns = []
+    seen_columns = set()
+    record_ids = []
+    cluster_ids = []
+    scores = []
+    source_files = []
+    for cluster in results:
+        for record in cluster['records']:
+            record_ids.append(int(record['record_id']))
+            cluster_ids.append(cluster['cluster_id'])
+            scores.append(record['confidence_score'])
+            source_files.append(record['source_file'])
+            for column in record:
+                if column not in seen_columns and column not in META_FIELDS:
+                    seen_columns.add(column)
+                    columns.append(column)
+
+    payload = {
+        'status': 'success',
+        'format': 'compact',
+        'result_id': result_id,
+        'record_count': len(record_ids),
+        'columns': columns,
+        'record_ids': np.asarray(record_ids, dtype='<i4').tobytes(),
+        'cluster_ids': np.asarray(cluster_ids, dtype='<i4').tobytes(),
+        'scores': np.asarray(scores, dtype='<f4').tobytes(),
+        'source_files': _dictionary_encode(source_files),
+        'clusters': {
+            'cluster_id': np.asarray([c['cluster_id'] for c in results], dtype='<i4').tobytes(),
+            'group_size': np.asarray([c['group_size'] for c in results], dtype='<i4').tobytes(),
+            'confidence_score': np.asarray([c['confidence_score'] for c in results], dtype='<f4').tobytes()
+        }
+    }
+
+    if any('explanation' in cluster for cluster in results):
+        payload['explanations'] = [cluster.get('explanation') for cluster in results]
+
+    if include_fields:
+        payload['fields'] = {
+            column: _dictionary_encode([
+                record.get(column, 'N/A')
+                for cluster in results
+                for record in cluster['records']
+            ])
+            for column in columns
+        }
+
+    return msgpack.packb(payload, use_bin_type=True)
+
+class ResultStore:
+    """
+    Short-lived in-memory store of full results, keyed by result id
+
+    Lets clients receive a compact payload without record fields and fetch
+    the full records for the clusters they actually open.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 20):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, results: List[Dict]) -> str:
+        result_id = uuid.uuid4().hex
+        records = {
+            record['record_id']: record
+            for cluster in results
+            for record in cluster['records']
+        }
+        with self._lock:
+            self._expire()
+            self._entries[result_id] = (time.monotonic(), records)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result_id
+
+    def get_records(self, result_id: str, record_ids: List[str]) -> Optional[List[Dict]]:
+        """Return the requested records, or None if the result expired"""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(result_id)
+        if entry is None:
+            return None
+        records = entry[1]
+        return [records[record_id] for record_id in record_ids if record_id in records]
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            result_id, (created, _) = next(iter(self._entries.items()))
+            if created >= cutoff:
+                break
+            self._entries.popitem(last=False)
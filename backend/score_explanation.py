@@ -0,0 +1,117 @@
+import logging
+from itertools import combinations, islice
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Keys added to clustered records that are not input fields
+META_FIELDS = ['confidence_score', 'source_file', 'record_id']
+
+def _linear_model(deduper) -> Optional[Tuple[np.ndarray, float]]:
+    """Return (coefficients, intercept) of the deduper's classifier, if it is linear"""
+    classifier = getattr(deduper, 'classifier', None)
+    estimator = getattr(classifier, 'best_estimator_', classifier)
+    if not hasattr(estimator, 'coef_'):
+        return None
+    return np.asarray(estimator.coef_, dtype='f8').ravel(), float(np.ravel(estimator.intercept_)[0])
+
+def feature_fields(data_model) -> List[str]:
+    """
+    Map every column of data_model.distances() to the field it describes
+
+    dedupe lays the columns out as: one or more per field variable (its
+    higher_vars when it has several), up to data_model._derived_start; then
+    the interaction terms, grouped under 'interactions'; then a missing-value
+    indicator for each column in data_model._missing_field_indices, credited
+    to the field of the column it flags.
+    """
+    columns = []
+    for variable in data_model.field_variables:
+        columns.extend([variable.field] * len(variable))
+    n_interactions = len(data_model) - data_model._derived_start - len(data_model._missing_field_indices)
+    columns.extend(['interactions'] * n_interactions)
+    return columns + [columns[index] for index in data_model._missing_field_indices]
+
+def explain_clusters(deduper, results: List[Dict], max_pairs_per_cluster: int = 50) -> List[Dict]:
+    """
+    Attach per-field score contributions to every cluster
+
+    The distances of all explained pairs, across all clusters, are computed in
+    one data_model.distances call and weighted by the classifier coefficients
+    in a single NumPy pass. A pair's contributions sum with the intercept to
+    the logit of its match probability.
+
+    Args:
+        deduper: Trained Dedupe or StaticDedupe instance
+        results: Clusters as returned by find_duplicates_in_files
+        max_pairs_per_cluster: Cap on explained pairs in large clusters
+
+    Returns:
+        The same clusters, each with an 'explanation' entry holding per-pair
+        contributions and per-record means
+    """
+    model = _linear_model(deduper)
+    if model is None:
+        logger.warning("Classifier has no linear coefficients; skipping score explanations")
+        return results
+    coefficients, intercept = model
+
+    fields = feature_fields(deduper.data_model)
+    unique_fields = list(dict.fromkeys(fields))
+    # Sums feature columns into per-field totals with one matrix product
+    membership = np.zeros((len(fields), len(unique_fields)), dtype='f8')
+    for column, field in enumerate(fields):
+        membership[column, unique_fields.index(field)] = 1.0
+
+    record_pairs = []
+    pair_index = []  # (cluster position, record id 1, record id 2)
+    for position, cluster in enumerate(results):
+        records = {
+            record['record_id']: {k: v for k, v in record.items() if k not in META_FIELDS}
+            for record in cluster['records']
+        }
+        for id_1, id_2 in islice(combinations(records, 2), max_pairs_per_cluster):
+            record_pairs.append((records[id_1], records[id_2]))
+            pair_index.append((position, id_1, id_2))
+
+    if not record_pairs:
+        return results
+
+    distances = np.nan_to_num(np.asarray(deduper.data_model.distances(record_pairs), dtype='f8'))
+    field_contributions = (distances * coefficients) @ membership
+    logits = field_contributions.sum(axis=1) + intercept
+    scores = 1.0 / (1.0 + np.exp(-logits))
+
+    # Mean contribution per record, over the explained pairs it appears in
+    groups = list(dict.fromkeys(
+        key for position, id_1, id_2 in pair_index for key in ((position, id_1), (position, id_2))
+    ))
+    group_of = {key: i for i, key in enumerate(groups)}
+    first = np.array([group_of[(position, id_1)] for position, id_1, _ in pair_index])
+    second = np.array([group_of[(position, id_2)] for position, _, id_2 in pair_index])
+    record_totals = np.zeros((len(groups), len(unique_fields)), dtype='f8')
+    np.add.at(record_totals, first, field_contributions)
+    np.add.at(record_totals, second, field_contributions)
+    record_counts = np.bincount(first, minlength=len(groups)) + np.bincount(second, minlength=len(groups))
+    record_means = (record_totals / record_counts[:, None]).tolist()
+
+    explanations = [
+        {'fields': unique_fields, 'intercept': intercept, 'pairs': [], 'records': {}}
+        for _ in results
+    ]
+    pair_contributions = field_contributions.tolist()
+    pair_scores = scores.tolist()
+    for row, (position, id_1, id_2) in enumerate(pair_index):
+        explanations[position]['pairs'].append({
+            'record_ids': [id_1, id_2],
+            'score': pair_scores[row],
+            'contributions': dict(zip(unique_fields, pair_contributions[row]))
+        })
+    for (position, record_id), means in zip(groups, record_means):
+        explanations[position]['records'][record_id] = dict(zip(unique_fields, means))
+
+    for cluster, explanation in zip(results, explanations):
+        cluster['explanation'] = explanation
+    return results
@@ -0,0 +1,48 @@
+"""Small real datasets and dedupe models shared by the tests"""
+import dedupe
+
+FIRST_NAMES = ['anna', 'bernd', 'carla', 'dieter', 'elena', 'frank', 'greta', 'hans', 'ines', 'jonas']
+CITIES = ['berlin', 'hamburg', 'munich', 'cologne', 'bremen']
+
+FIELDS = [
+    {'field': 'name', 'type': 'String', 'has_missing': True},
+    {'field': 'city', 'type': 'String', 'has_missing': True}
+]
+
+def people() -> dict:
+    """Forty records: every person twice, once with a typo, plus distinct fillers"""
+    records = {}
+    for i, first_name in enumerate(FIRST_NAMES):
+        name = f"{first_name} {'schmidt' if i % 2 else 'mueller'}"
+        city = CITIES[i % len(CITIES)]
+        records[str(len(records))] = {'name': name, 'city': city}
+        records[str(len(records))] = {'name': name[:-1] + 'x', 'city': city}
+    for i in range(20):
+        records[str(len(records))] = {'name': f"person {i} zzz{i}", 'city': CITIES[(i + 2) % len(CITIES)]}
+    return records
+
+def labelled_pairs(records: dict) -> dict:
+    """Typo duplicates as matches, neighbouring people as distincts"""
+    match = [(records[str(i)], records[str(i + 1)]) for i in range(0, 20, 2)]
+    distinct = [(records[str(i)], records[str(i + 2)]) for i in range(0, 18, 2)]
+    return {'match': match, 'distinct': distinct}
+
+def as_training_data(pairs: dict) -> list:
+    """Labelled pairs in the API's format"""
+    return [
+        {'0': first, '1': second, 'answer': 'y' if label == 'match' else 'n'}
+        for label in ('match', 'distinct')
+        for first, second in pairs[label]
+    ]
+
+def prepared_deduper(num_cores: int = 1):
+    from dedupe_script import build_variable_definition
+    deduper = dedupe.Dedupe(build_variable_definition(FIELDS), num_cores=num_cores)
+    deduper.prepare_training(people())
+    return deduper
+
+def trained_deduper(num_cores: int = 1):
+    deduper = prepared_deduper(num_cores)
+    deduper.mark_pairs(labelled_pairs(people()))
+    deduper.train()
+    return deduper
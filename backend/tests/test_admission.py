@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, AdmittedJob, JobCost, estimate_job_cost
+
+def run(coro):
+    return asyncio.run(coro)
+
+def cost(memory_mb: int) -> JobCost:
+    return JobCost(rows=0, memory_mb=memory_mb)
+
+def test_admits_immediately_when_job_fits():
+    async def scenario():
+        controller = AdmissionController(max_running=2, memory_budget_mb=1000)
+        await controller.acquire(cost(400))
+        await controller.acquire(cost(400))
+        return controller.stats()
+
+    stats = run(scenario())
+    assert stats['running'] == 2
+    assert stats['memory_in_use_mb'] == 800
+    assert stats['queued'] == 0
+
+def test_waiters_are_granted_first_in_first_out():
+    async def scenario():
+        controller = AdmissionController(max_running=3, memory_budget_mb=1000)
+        await controller.acquire(cost(600))
+        order = []
+
+        async def job(name, memory_mb):
+            await controller.acquire(cost(memory_mb))
+            order.append(name)
+
+        large = asyncio.create_task(job('large', 900))
+        await asyncio.sleep(0)
+        # Fits the remaining budget, but must not overtake the queued large job
+        small = asyncio.create_task(job('small', 100))
+        await asyncio.sleep(0.01)
+        assert order == []
+
+        controller.release(cost(600), 1.0)
+        await asyncio.gather(large, small)
+        return order
+
+    assert run(scenario()) == ['large', 'small']
+
+def test_job_larger_than_budget_runs_alone():
+    async def scenario():
+        controller = AdmissionController(max_running=2, memory_budget_mb=1000)
+        await controller.acquire(cost(5000))
+        return controller.stats()
+
+    assert run(scenario())['running'] == 1
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_running=1, memory_budget_mb=1000, max_queued=1)
+        await controller.acquire(cost(100))
+        queued = asyncio.create_task(controller.acquire(cost(100)))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(cost(100))
+        queued.cancel()
+        return rejected.value
+
+    rejected = run(scenario())
+    assert rejected.retry_after >= 1
+
+def test_queue_timeout_rejects_and_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_running=1, memory_budget_mb=1000, queue_timeout=0.05)
+        await controller.acquire(cost(100))
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(cost(100))
+        return controller.stats()
+
+    stats = run(scenario())
+    assert stats['queued'] == 0
+    assert stats['running'] == 1
+
+def test_cancelled_waiter_is_removed_and_does_not_hold_a_slot():
+    async def scenario():
+        controller = AdmissionController(max_running=1, memory_budget_mb=1000)
+        await controller.acquire(cost(100))
+        waiter = asyncio.create_task(controller.acquire(cost(100)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.stats()['queued'] == 0
+
+        controller.release(cost(100), None)
+        return controller.stats()
+
+    stats = run(scenario())
+    assert stats['running'] == 0
+    assert stats['memory_in_use_mb'] == 0
+
+def test_cancellation_racing_a_grant_neither_leaks_nor_double_releases():
+    async def scenario():
+        controller = AdmissionController(max_running=1, memory_budget_mb=1000)
+        await controller.acquire(cost(100))
+        waiter = asyncio.create_task(controller.acquire(cost(200)))
+        await asyncio.sleep(0)
+        # Grant the waiter, then cancel it before it gets to run
+        controller.release(cost(100), None)
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        else:
+            # The grant won the race; the job owns the slot and releases it
+            controller.release(cost(200), None)
+        return controller.stats()
+
+    stats = run(scenario())
+    assert stats['running'] == 0
+    assert stats['memory_in_use_mb'] == 0
+
+def test_admitted_job_releases_on_error():
+    async def scenario():
+        controller = AdmissionController(max_running=1, memory_budget_mb=1000)
+        with pytest.raises(ValueError):
+            async with AdmittedJob(controller, cost(100)):
+                raise ValueError("job failed")
+        return controller.stats()
+
+    stats = run(scenario())
+    assert stats['running'] == 0
+    assert stats['memory_in_use_mb'] == 0
+
+def test_estimate_job_cost_counts_csv_rows(tmp_path):
+    path = tmp_path / 'input.csv'
+    path.write_text("name,city\n" + "".join(f"n{i},c{i}\n" for i in range(10)))
+
+    in_memory = estimate_job_cost([str(path)])
+    out_of_core = estimate_job_cost([str(path)], out_of_core=True)
+
+    assert in_memory.rows == 10
+    assert out_of_core.rows == 10
+    assert out_of_core.memory_mb > in_memory.memory_mb
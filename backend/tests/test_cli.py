@@ -0,0 +1,75 @@
+import csv
+import json
+
+import pytest
+
+import cli
+from cli import expand_inputs, write_results
+from dedupe_helpers import people
+
+def make_results():
+    return [
+        {'cluster_id': 0, 'records': [
+            {'name': 'ann', 'record_id': 'a.csv:0', 'confidence_score': 0.9, 'source_file': 'a.csv'},
+            {'name': 'anne', 'record_id': 'a.csv:1', 'confidence_score': 0.8, 'source_file': 'a.csv'}
+        ]},
+        {'cluster_id': 1, 'records': [
+            {'name': 'bob', 'email': 'bob@example.com', 'record_id': 'b.csv:0', 'confidence_score': 0.7, 'source_file': 'b.csv'}
+        ]}
+    ]
+
+def test_expand_inputs_sorts_and_deduplicates(tmp_path):
+    for name in ('b.csv', 'a.csv'):
+        (tmp_path / name).write_text("name\n")
+    files = expand_inputs([str(tmp_path / '*.csv'), str(tmp_path / 'a.csv')])
+    assert files == [str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')]
+
+def test_expand_inputs_rejects_unmatched_patterns(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        expand_inputs([str(tmp_path / '*.xlsx')])
+
+def test_csv_header_covers_columns_of_later_files(tmp_path):
+    output = tmp_path / 'out.csv'
+    assert write_results(make_results(), str(output), 'csv') == 3
+
+    with open(output, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0].keys()) == ['cluster_id', 'name', 'email', 'record_id', 'confidence_score', 'source_file']
+    assert rows[0]['email'] == ''
+    assert rows[2]['email'] == 'bob@example.com'
+
+def test_ndjson_writes_one_row_per_record(tmp_path):
+    output = tmp_path / 'out.ndjson'
+    assert write_results(make_results(), str(output), 'ndjson') == 3
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [row['cluster_id'] for row in rows] == [0, 0, 1]
+
+def test_missing_pyarrow_fails_before_the_run(tmp_path, monkeypatch):
+    def unavailable():
+        raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+
+    def never_called(**kwargs):
+        raise AssertionError("dedupe must not run without a way to write the output")
+
+    import worker_pool
+    monkeypatch.setattr(cli, 'import_pyarrow', unavailable)
+    monkeypatch.setattr(worker_pool, 'run_dedupe_job', never_called)
+    input_file = tmp_path / 'input.csv'
+    input_file.write_text("name\nann\n")
+
+    assert cli.main([str(input_file), '-o', str(tmp_path / 'out.parquet')]) == 1
+
+def test_default_command_writes_training_pairs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    input_file = tmp_path / 'people.csv'
+    with open(input_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['name', 'city'])
+        writer.writeheader()
+        writer.writerows(people().values())
+
+    # No --selected-columns, settings or labels
+    assert cli.main([str(input_file), '-o', str(tmp_path / 'out.csv'), '--cores', '1']) == 2
+
+    pairs = json.loads((tmp_path / 'out.pairs.json').read_text())
+    assert pairs
+    assert all({'0', '1'} <= set(pair) for pair in pairs)
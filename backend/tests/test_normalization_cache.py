@@ -0,0 +1,67 @@
+import json
+
+from normalization_cache import NormalizationCache
+
+def test_hits_misses_and_lru_eviction():
+    cache = NormalizationCache(max_size=2)
+    cache.get_or_compute('a', str.upper)
+    cache.get_or_compute('b', str.upper)
+    cache.get_or_compute('a', str.upper)
+    cache.get_or_compute('c', str.upper)  # Evicts b, the least recently used
+
+    calls = []
+    cache.get_or_compute('b', lambda key: calls.append(key) or key.upper())
+    assert calls == ['b']
+
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 4
+    assert stats['evictions'] == 2
+    assert stats['size'] == 2
+
+def test_persisted_entries_are_loaded(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    first = NormalizationCache(persist_path=path)
+    first.get_or_compute('Köln', lambda key: 'koln')
+    first.save()
+
+    second = NormalizationCache(persist_path=path)
+    assert second.get_or_compute('Köln', lambda key: 'recomputed') == 'koln'
+    assert second.stats()['hits'] == 1
+
+def test_save_merges_with_entries_from_other_workers(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    worker_1 = NormalizationCache(persist_path=path)
+    worker_2 = NormalizationCache(persist_path=path)
+    worker_1.get_or_compute('a', str.upper)
+    worker_2.get_or_compute('b', str.upper)
+
+    worker_1.save()
+    worker_2.save()
+
+    with open(path) as f:
+        assert json.load(f) == {'a': 'A', 'b': 'B'}
+
+def test_save_keeps_the_most_recent_entries(tmp_path):
+    path = str(tmp_path / 'cache.json')
+    with open(path, 'w') as f:
+        json.dump({'old': 'OLD', 'shared': 'STALE'}, f)
+
+    # A worker that started before the file was written, so never loaded it
+    cache = NormalizationCache(max_size=2)
+    cache.persist_path = path
+    cache.get_or_compute('shared', str.upper)
+    cache.get_or_compute('new', str.upper)
+    cache.save()
+
+    with open(path) as f:
+        assert json.load(f) == {'shared': 'SHARED', 'new': 'NEW'}
+
+def test_corrupt_file_is_ignored(tmp_path):
+    path = tmp_path / 'cache.json'
+    path.write_text('{not json')
+    cache = NormalizationCache(persist_path=str(path))
+    assert cache.stats()['size'] == 0
+    cache.get_or_compute('a', str.upper)
+    cache.save()
+    assert json.loads(path.read_text()) == {'a': 'A'}
@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from dedupe_script import convert_df_to_dedupe_format, detect_fields, read_input_files
+from out_of_core import RecordStore, iter_file_chunks, normalize_headers
+
+def in_memory_records(file_path, chunk_size=3):
+    return convert_df_to_dedupe_format(read_input_files([file_path], chunk_size=chunk_size))
+
+def out_of_core_records(file_path, tmp_path):
+    fields = [field['field'] for field in detect_fields(file_path)[0]]
+    store = RecordStore(str(tmp_path / 'records.sqlite'), fields)
+    try:
+        store.load_files([file_path], chunk_size=3)
+        return dict(store.iter_records())
+    finally:
+        store.close()
+
+def write_sheet(path, rows, blank_rows_after=0):
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    if blank_rows_after:
+        # A formatted but empty cell makes openpyxl report a larger max_row
+        sheet.cell(row=len(rows) + blank_rows_after, column=1).number_format = '0'
+    workbook.save(path)
+
+def test_normalize_headers_matches_pandas():
+    assert normalize_headers(['a', 'a', None, 'a.1', 'b', 'a', None]) == [
+        'a', 'a.1', 'Unnamed: 2', 'a.1.1', 'b', 'a.2', 'Unnamed: 6'
+    ]
+
+def test_integer_columns_with_gaps_normalize_the_same_in_every_chunk(tmp_path):
+    path = tmp_path / 'input.csv'
+    # The first chunk of 3 rows has no gaps, the second has one
+    path.write_text("name,code\nann,210019\nbob,210020\ncat,210021\ndan,\nann,210019\neve,210022\n")
+
+    records = out_of_core_records(str(path), tmp_path)
+    assert records['0']['code'] == records['4']['code']
+    assert records == in_memory_records(str(path))
+
+def test_excel_blank_rows_match_pandas(tmp_path):
+    path = str(tmp_path / 'input.xlsx')
+    write_sheet(path, [
+        ['name', 'name', None],
+        ['ann', 'x', 1],
+        [None, None, None],  # Interior blank row, kept by pd.read_excel
+        ['bob', 'y', 2],
+    ], blank_rows_after=5)
+
+    expected = pd.read_excel(path)
+    chunks = list(iter_file_chunks(path, chunk_size=2))
+    assert list(chunks[0].columns) == list(expected.columns)
+    assert sum(len(chunk) for chunk in chunks) == len(expected) == 3
+
+    assert out_of_core_records(path, tmp_path) == in_memory_records(path, chunk_size=100)
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordStore(str(tmp_path / 'records.sqlite'), ['name'])
+    chunk = pd.DataFrame({'name': ['ann', 'anne', 'bob', 'rob'], 'source_file': 'a.csv'})
+    store.insert_chunk(chunk)
+    yield store
+    store.close()
+
+def test_candidate_pairs_are_distinct(store):
+    store.write_blocking_map([
+        ('an', '0'), ('an', '1'),
+        ('n', '0'), ('n', '1'), ('n', '2'),
+        ('ob', '2'), ('ob', '3'),
+    ])
+    pairs = [(a[0], b[0]) for a, b in store.candidate_pairs()]
+    assert pairs == [('0', '1'), ('0', '2'), ('1', '2'), ('2', '3')]
+
+    first = next(iter(store.candidate_pairs()))
+    assert first == (('0', {'name': 'ann'}), ('1', {'name': 'anne'}))
+
+def test_candidate_pairs_skip_oversized_blocks(store):
+    store.write_blocking_map([
+        ('an', '0'), ('an', '1'),
+        ('n', '0'), ('n', '1'), ('n', '2'),
+    ])
+    pairs = [(a[0], b[0]) for a, b in store.candidate_pairs(max_block_size=2)]
+    assert pairs == [('0', '1')]
+
+def test_get_records_ignores_unknown_ids(store):
+    found = store.get_records(['1', '99'])
+    assert found == {'1': ({'name': 'anne'}, 'a.csv')}
@@ -0,0 +1,54 @@
+import msgpack
+import numpy as np
+import pytest
+
+import result_encoding
+from result_encoding import ResultStore, encode_compact
+
+RESULTS = [
+    {
+        'cluster_id': 0,
+        'group_size': 2,
+        'confidence_score': 0.9,
+        'records': [
+            {'name': 'ann', 'country': 'de', 'record_id': '3', 'confidence_score': 0.9, 'source_file': 'a.csv'},
+            {'name': 'anne', 'country': 'de', 'record_id': '7', 'confidence_score': 0.8, 'source_file': 'b.csv'}
+        ]
+    }
+]
+
+def test_encode_compact_round_trip():
+    payload = msgpack.unpackb(encode_compact(RESULTS), raw=False)
+
+    assert payload['record_count'] == 2
+    assert payload['columns'] == ['name', 'country']
+    assert np.frombuffer(payload['record_ids'], dtype='<i4').tolist() == [3, 7]
+    assert np.frombuffer(payload['scores'], dtype='<f4').tolist() == pytest.approx([0.9, 0.8])
+    country = payload['fields']['country']
+    assert country['dictionary'] == ['de']
+    assert np.frombuffer(country['codes'], dtype='<i4').tolist() == [0, 0]
+
+def test_encode_compact_without_fields():
+    payload = msgpack.unpackb(encode_compact(RESULTS, include_fields=False, result_id='abc'), raw=False)
+    assert 'fields' not in payload
+    assert payload['result_id'] == 'abc'
+
+def test_store_returns_requested_records_only():
+    store = ResultStore()
+    result_id = store.put(RESULTS)
+    records = store.get_records(result_id, ['7', 'missing'])
+    assert [record['name'] for record in records] == ['anne']
+
+def test_store_expires_entries(monkeypatch):
+    store = ResultStore(ttl_seconds=10)
+    result_id = store.put(RESULTS)
+    real_monotonic = result_encoding.time.monotonic
+    monkeypatch.setattr(result_encoding.time, 'monotonic', lambda: real_monotonic() + 11)
+    assert store.get_records(result_id, ['3']) is None
+
+def test_store_evicts_oldest_entry():
+    store = ResultStore(max_entries=1)
+    first = store.put(RESULTS)
+    second = store.put(RESULTS)
+    assert store.get_records(first, ['3']) is None
+    assert store.get_records(second, ['3']) is not None
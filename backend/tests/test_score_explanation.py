@@ -0,0 +1,38 @@
+import dedupe
+import numpy as np
+from dedupe.variables import Categorical, Interaction, String
+
+from dedupe_helpers import people, trained_deduper
+from score_explanation import explain_clusters, feature_fields
+
+def test_feature_fields_follow_dedupe_column_layout():
+    data_model = dedupe.Dedupe([
+        String('name', name='name', has_missing=True),
+        Categorical('kind', categories=['person', 'company'], name='kind'),
+        String('city', name='city'),
+        Interaction('name', 'city')
+    ]).data_model
+
+    # Field columns, the interaction, then missing indicators for name and
+    # for the interaction, which inherits has_missing from name
+    assert feature_fields(data_model) == ['name', 'kind', 'kind', 'city', 'interactions', 'name', 'interactions']
+    assert len(feature_fields(data_model)) == len(data_model)
+
+def test_contributions_are_keyed_by_input_fields():
+    deduper = trained_deduper()
+    records = people()
+    results = [{'cluster_id': 0, 'records': [
+        {**records['0'], 'record_id': '0', 'confidence_score': 0.9, 'source_file': 'a.csv'},
+        {**records['1'], 'record_id': '1', 'confidence_score': 0.9, 'source_file': 'a.csv'}
+    ]}]
+
+    explanation = explain_clusters(deduper, results)[0]['explanation']
+    pair = explanation['pairs'][0]
+    assert explanation['fields'] == ['name', 'city']
+    assert set(pair['contributions']) == {'name', 'city'}
+    assert set(explanation['records']) == {'0', '1'}
+
+    # Contributions and intercept add up to the classifier's own score
+    distances = deduper.data_model.distances([(records['0'], records['1'])])
+    expected = deduper.classifier.predict_proba(np.nan_to_num(distances))[0, 1]
+    assert abs(pair['score'] - expected) < 1e-5
@@ -0,0 +1,82 @@
+import pytest
+
+import training_sample
+from training_sample import _allocate, hash_files, sample_record_ids, select_training_sample
+
+def make_records(count, source_file='a.csv', name=lambda i: f"name {i}"):
+    return [
+        (f"{source_file}:{i}", {'name': name(i), 'city': f"city {i % 7}"}, source_file)
+        for i in range(count)
+    ]
+
+def test_allocate_is_proportional_and_exact():
+    allocation = _allocate({'a': 300, 'b': 100}, 10)
+    assert sum(allocation.values()) == 10
+    assert allocation['a'] > allocation['b']
+
+def test_sample_is_deterministic_and_bounded():
+    records = make_records(1000)
+    first = sample_record_ids(records, 50, ['name', 'city'], seed=3)
+    second = sample_record_ids(records, 50, ['name', 'city'], seed=3)
+    assert first == second
+    assert len(first) == 50
+    assert len(set(first)) == 50
+
+def test_sample_covers_every_file():
+    records = make_records(900, 'large.csv') + make_records(100, 'small.csv')
+    sample = sample_record_ids(records, 100, ['name'], pair_fraction=0)
+    sources = {record_id.split(':')[0] for record_id in sample}
+    assert sources == {'large.csv', 'small.csv'}
+
+def test_sample_includes_likely_duplicate_pairs():
+    # Only records 0 and 500 share a blocking key prefix
+    records = make_records(1000, name=lambda i: 'smith' if i in (0, 500) else f"{i:06d}")
+    sample = sample_record_ids(records, 20, ['name'], pair_fraction=0.5)
+    assert 'a.csv:0' in sample
+    assert 'a.csv:500' in sample
+
+FILES_HASH = 'f' * 64
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(training_sample, 'SAMPLE_CACHE_DIR', str(tmp_path / 'cache'))
+    return {
+        'fields': [{'field': 'name'}, {'field': 'city'}],
+        'max_training_rows': 10,
+        'out_of_core': False
+    }
+
+def _unused_records():
+    raise AssertionError("records must not be read on a cache hit")
+    yield
+
+def test_select_reuses_cached_sample(config):
+    first = select_training_sample(FILES_HASH, make_records(100), config, 100)
+    second = select_training_sample(FILES_HASH, _unused_records(), config, 100)
+    assert first == second
+
+def test_cache_is_keyed_on_files_mode_and_record_count(config):
+    select_training_sample(FILES_HASH, make_records(100), config, 100)
+
+    other_files = select_training_sample('e' * 64, make_records(50), config, 50)
+    assert all(int(record_id.split(':')[1]) < 50 for record_id in other_files)
+
+    out_of_core = select_training_sample(FILES_HASH, make_records(80), {**config, 'out_of_core': True}, 80)
+    assert all(int(record_id.split(':')[1]) < 80 for record_id in out_of_core)
+
+    fewer_records = select_training_sample(FILES_HASH, make_records(60), config, 60)
+    assert all(int(record_id.split(':')[1]) < 60 for record_id in fewer_records)
+
+def test_input_files_are_hashed_once_per_job(tmp_path, monkeypatch):
+    import dedupe_script
+
+    input_file = tmp_path / 'input.csv'
+    input_file.write_text("name,city\nann,berlin\n")
+    calls = []
+    monkeypatch.setattr(dedupe_script, 'hash_files', lambda paths: calls.append(paths) or hash_files(paths))
+
+    job_config = {}
+    first = dedupe_script.input_files_hash([str(input_file)], job_config)
+    second = dedupe_script.input_files_hash([str(input_file)], job_config)
+    assert first == second == hash_files([str(input_file)])
+    assert len(calls) == 1
@@ -0,0 +1,133 @@
+import csv
+import os
+import pickle
+
+import dedupe
+import pytest
+
+import dedupe_script
+import training_sample
+import training_session
+from dedupe_helpers import FIELDS, as_training_data, labelled_pairs, people, prepared_deduper
+from training_session import (
+    TrainingSession,
+    TrainingSessionCache,
+    is_valid_session_id,
+    new_session_id,
+    pair_key,
+    snapshot_deduper,
+)
+
+def make_session(state=None, files_hash='files') -> TrainingSession:
+    return TrainingSession(deduper_state=pickle.dumps(state or {'weights': [1, 2]}), files_hash=files_hash)
+
+@pytest.fixture
+def cache(tmp_path):
+    return TrainingSessionCache(ttl_seconds=60, max_entries=2, cache_dir=str(tmp_path))
+
+@pytest.mark.parametrize('session_id', ['../../x', '/etc/passwd', 'a' * 64, 'ABCDEF' * 6, '', None])
+def test_rejects_ids_not_issued_by_the_server(cache, session_id):
+    assert not is_valid_session_id(session_id)
+    with pytest.raises(ValueError):
+        cache.get(session_id)
+    with pytest.raises(ValueError):
+        cache.put(session_id, make_session())
+
+def test_new_session_ids_are_valid_and_unique():
+    ids = {new_session_id() for _ in range(100)}
+    assert len(ids) == 100
+    assert all(is_valid_session_id(session_id) for session_id in ids)
+
+def test_session_survives_a_new_process_via_disk(cache, tmp_path):
+    session_id = new_session_id()
+    cache.put(session_id, make_session())
+
+    other_worker = TrainingSessionCache(ttl_seconds=60, cache_dir=str(tmp_path))
+    session = other_worker.get(session_id)
+    assert session.files_hash == 'files'
+    assert pickle.loads(session.deduper_state) == {'weights': [1, 2]}
+
+def test_expired_sessions_are_dropped(cache, monkeypatch):
+    session_id = new_session_id()
+    cache.put(session_id, make_session())
+    path = os.path.join(cache.cache_dir, f"{session_id}.pkl")
+    real_time = training_session.time.time
+    monkeypatch.setattr(training_session.time, 'time', lambda: real_time() + 120)
+
+    assert cache.get(session_id) is None
+    assert not os.path.exists(path)
+
+def test_least_recently_used_session_is_evicted_from_memory(tmp_path):
+    cache = TrainingSessionCache(ttl_seconds=60, max_entries=2, cache_dir=None)
+    first, second, third = new_session_id(), new_session_id(), new_session_id()
+    cache.put(first, make_session())
+    cache.put(second, make_session())
+    cache.get(first)
+    cache.put(third, make_session())
+
+    assert cache.get(first) is not None
+    assert cache.get(second) is None
+    assert cache.get(third) is not None
+
+def test_unpicklable_deduper_is_not_cached():
+    assert snapshot_deduper(lambda: None) is None
+    assert pickle.loads(snapshot_deduper({'a': 1})) == {'a': 1}
+
+def test_pair_key_ignores_answer_and_metadata():
+    pair = {'0': {'name': 'ann', 'record_id': '1'}, '1': {'name': 'anne', 'record_id': '2'}, 'answer': 'y'}
+    relabelled = {'0': {'name': 'ann', 'confidence_score': 0.9}, '1': {'name': 'anne'}, 'answer': 'n'}
+    assert pair_key(pair) == pair_key(relabelled)
+    assert TrainingSession(b'', 'files', marked={pair_key(pair)}).unmarked([relabelled]) == []
+
+def is_typo_pair(first, second):
+    return first['city'] == second['city'] and first['name'][:-1] == second['name'][:-1]
+
+def label(pairs):
+    return [{'0': first, '1': second, 'answer': 'y' if is_typo_pair(first, second) else 'n'} for first, second in pairs]
+
+def test_restored_deduper_marks_and_trains():
+    deduper = prepared_deduper()
+    # Pairs handed out for labelling leave the active learner's candidates
+    batch = [deduper.uncertain_pairs()[0] for _ in range(5)]
+    session = TrainingSession(deduper_state=snapshot_deduper(deduper), files_hash='files')
+
+    labels = label(batch) + as_training_data(labelled_pairs(people()))
+    restored = session.load_deduper(labels)
+    restored.mark_pairs(dedupe_script.format_labelled_pairs(labels))
+    restored.train()
+
+    clusters = restored.partition(people(), 0.5)
+    assert any(set(record_ids) == {'0', '1'} for record_ids, _ in clusters)
+
+    # Every load starts from the snapshot again
+    assert len(session.load_deduper([]).training_pairs['match']) == 0
+
+def test_labelling_rounds_resume_the_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedupe_script, 'training_sessions', TrainingSessionCache(cache_dir=str(tmp_path / 'sessions')))
+    monkeypatch.setattr(training_sample, 'SAMPLE_CACHE_DIR', str(tmp_path / 'samples'))
+    input_file = tmp_path / 'people.csv'
+    with open(input_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['name', 'city'])
+        writer.writeheader()
+        writer.writerows(people().values())
+    config = {'fields': FIELDS, 'num_cores': 1}
+
+    first = dedupe_script.find_duplicates_in_files(None, [str(input_file)], config=dict(config))
+    session_id = first['session_id']
+    assert first['pairs']
+    labels = label((pair['0'], pair['1']) for pair in first['pairs'])
+
+    def no_prepare(*args, **kwargs):
+        raise AssertionError("a resumed session must not prepare training again")
+    monkeypatch.setattr(dedupe.Dedupe, 'prepare_training', no_prepare)
+
+    second = dedupe_script.find_duplicates_in_files(
+        labels, [str(input_file)], config={**config, 'session_id': session_id, 'next_batch': True}
+    )
+    assert second['session_id'] == session_id
+    labels += label((pair['0'], pair['1']) for pair in second['pairs'])
+
+    results = dedupe_script.find_duplicates_in_files(
+        labels, [str(input_file)], config={**config, 'session_id': session_id}
+    )
+    assert isinstance(results, list)
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+import worker_pool
+from dedupe_helpers import people, trained_deduper
+from worker_pool import JobMemoryExceeded, JobTimeExceeded, WorkerCrashed, WorkerPool, run_with_budget
+
+def _pid() -> int:
+    return os.getpid()
+
+def _crash():
+    # Dies the way a worker killed by the OOM killer does, without cleanup
+    os._exit(1)
+
+async def _wait_until_ready(pool: WorkerPool, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while not pool.ready:
+        assert time.monotonic() < deadline, "worker pool did not warm up"
+        await asyncio.sleep(0.1)
+
+def test_pool_is_rebuilt_after_a_worker_dies():
+    async def scenario():
+        pool = WorkerPool(size=1)
+        pool.start()
+        try:
+            await _wait_until_ready(pool)
+            before = await pool.run(_pid)
+
+            with pytest.raises(WorkerCrashed):
+                await pool.run(_crash)
+            assert not pool.ready
+
+            after = await pool.run(_pid)
+            await _wait_until_ready(pool)
+            return before, after
+        finally:
+            pool.shutdown()
+
+    before, after = asyncio.run(scenario())
+    assert before != after
+
+def test_run_before_start_fails():
+    with pytest.raises(RuntimeError):
+        asyncio.run(WorkerPool(size=1).run(_pid))
+
+def _allocate(megabytes: int):
+    blocks = []
+    for _ in range(megabytes // 20):
+        # Filled so the pages are actually resident
+        blocks.append(b'x' * (20 * 1024 * 1024))
+        time.sleep(0.1)
+    return len(blocks)
+
+def _wrap_errors_like_dedupe():
+    # Dedupe.score turns any RuntimeError into a generic one; other code
+    # might wrap everything
+    try:
+        time.sleep(10)
+    except Exception as e:
+        raise RuntimeError("wrapped") from e
+
+def _swallow_errors():
+    try:
+        time.sleep(10)
+    except Exception:
+        return 'swallowed'
+
+def _endless_scoring(num_cores: int):
+    """Score an endless stream of pairs with a real trained deduper"""
+    deduper = trained_deduper(num_cores)
+    records = people()
+
+    def pairs():
+        while True:
+            yield ('0', records['0']), ('1', records['1'])
+
+    return deduper.score(pairs())
+
+def test_memory_budget_counts_growth_only():
+    ballast = b'x' * (300 * 1024 * 1024)  # Held before the job, like warm caches
+    assert run_with_budget(_allocate, max_rss_mb=200, megabytes=100) == 5
+    assert len(ballast)
+    with pytest.raises(JobMemoryExceeded):
+        run_with_budget(_allocate, max_rss_mb=200, megabytes=600)
+
+@pytest.mark.parametrize('job', [_wrap_errors_like_dedupe, _swallow_errors])
+def test_breach_is_reported_even_if_the_job_hides_it(job):
+    with pytest.raises(JobTimeExceeded):
+        run_with_budget(job, max_seconds=1)
+
+@pytest.mark.parametrize('num_cores', [1, 2])
+def test_breach_during_dedupe_scoring_recycles_the_worker(monkeypatch, num_cores):
+    monkeypatch.setattr(worker_pool, 'RETIRE_GRACE_SECONDS', 0.5)
+
+    async def scenario():
+        pool = WorkerPool(size=1)
+        pool.start()
+        try:
+            await _wait_until_ready(pool)
+            with pytest.raises(JobTimeExceeded) as aborted:
+                await pool.run(run_with_budget, job=_endless_scoring, max_seconds=3, num_cores=num_cores)
+            assert not pool.ready
+
+            # With num_cores=1 the scoring thread stays blocked, so the
+            # worker only goes away when it is killed
+            deadline = time.monotonic() + 30
+            while worker_pool._is_child_process(aborted.value.pid):
+                assert time.monotonic() < deadline, "aborted worker was not retired"
+                await asyncio.sleep(0.2)
+
+            return aborted.value.pid, await pool.run(_pid)
+        finally:
+            pool.shutdown()
+
+    aborted_pid, next_pid = asyncio.run(scenario())
+    assert next_pid != aborted_pid
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_CACHE_DIR = os.environ.get(
+    'TRAINING_SAMPLE_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'dedupe_training_samples')
+)
+
+# Cheap blocking key: this many leading alphanumeric characters per column
+KEY_PREFIX_LENGTH = 6
+# Pairs emitted per cheap key, so very common keys cannot dominate the sample
+MAX_PAIRS_PER_KEY = 20
+# Distinct cheap keys remembered while streaming, bounding memory
+MAX_TRACKED_KEYS = 200000
+
+def hash_files(file_paths: List[str]) -> str:
+    """Return a SHA-256 over the contents of the files, in order"""
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def _cheap_key(record: Dict[str, str], columns: List[str]) -> Optional[Tuple[str, ...]]:
+    """Compound key of the normalized prefixes of the blocking columns"""
+    parts = []
+    for column in columns:
+        value = record.get(column, 'N/A')
+        if value == 'N/A':
+            return None
+        prefix = re.sub(r'[^0-9a-z]', '', value)[:KEY_PREFIX_LENGTH]
+        if not prefix:
+            return None
+        parts.append(prefix)
+    return tuple(parts)
+
+def _reservoir_add(reservoir: List, seen: int, item, capacity: int, rng: random.Random):
+    """Algorithm R: keep a uniform sample of capacity items from a stream"""
+    if len(reservoir) < capacity:
+        reservoir.append(item)
+    else:
+        j = rng.randrange(seen)
+        if j < capacity:
+            reservoir[j] = item
+
+def _allocate(counts: Dict[str, int], total: int) -> Dict[str, int]:
+    """Split total slots across strata proportionally, by largest remainder"""
+    population = sum(counts.values())
+    if population == 0:
+        return {stratum: 0 for stratum in counts}
+    quotas = {stratum: total * count / population for stratum, count in counts.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    remaining = total - sum(allocation.values())
+    for stratum in sorted(quotas, key=lambda s: quotas[s] - allocation[s], reverse=True)[:remaining]:
+        allocation[stratum] += 1
+    return allocation
+
+def sample_record_ids(
+    records: Iterable[Tuple[str, Dict[str, str], str]],
+    max_rows: int,
+    blocking_columns: List[str],
+    pair_fraction: float = 0.5,
+    seed: int = 0
+) -> List[str]:
+    """
+    Draw a training sample in a single streaming pass over all records
+
+    Part of the sample comes from likely duplicate pairs: records sharing a
+    cheap blocking key (prefixes of the blocking columns) are reservoir-sampled
+    as pairs. The rest is a uniform reservoir sample per source file, allocated
+    proportionally to each file's size.
+
+    Args:
+        records: Iterable of (record_id, record, source_file) tuples
+        max_rows: Number of record ids to return
+        blocking_columns: Columns used to build the cheap blocking key
+        pair_fraction: Share of the sample reserved for likely duplicate pairs
+        seed: Random seed, so the same input always gives the same sample
+
+    Returns:
+        List of sampled record ids
+    """
+    rng = random.Random(seed)
+    pair_capacity = int(max_rows * pair_fraction) // 2
+
+    strata: Dict[str, List[str]] = {}
+    stratum_counts: Dict[str, int] = {}
+    key_first_seen: Dict[Tuple[str, ...], str] = {}
+    key_pairs: Dict[Tuple[str, ...], int] = {}
+    pair_reservoir: List[Tuple[str, str]] = []
+    pairs_seen = 0
+
+    for record_id, record, source_file in records:
+        stratum_counts[source_file] = stratum_counts.get(source_file, 0) + 1
+        _reservoir_add(
+            strata.setdefault(source_file, []), stratum_counts[source_file], record_id, max_rows, rng
+        )
+
+        if pair_capacity == 0:
+            continue
+        key = _cheap_key(record, blocking_columns)
+        if key is None:
+            continue
+        first_id = key_first_seen.get(key)
+        if first_id is None:
+            if len(key_first_seen) < MAX_TRACKED_KEYS:
+                key_first_seen[key] = record_id
+            continue
+        if key_pairs.get(key, 0) < MAX_PAIRS_PER_KEY:
+            key_pairs[key] = key_pairs.get(key, 0) + 1
+            pairs_seen += 1
+            _reservoir_add(pair_reservoir, pairs_seen, (first_id, record_id), pair_capacity, rng)
+
+    sample: Dict[str, None] = {}
+    for first_id, second_id in pair_reservoir:
+        sample[first_id] = None
+        sample[second_id] = None
+
+    allocation = _allocate(stratum_counts, max(max_rows - len(sample), 0))
+    for source_file, reservoir in strata.items():
+        rng.shuffle(reservoir)
+        added = 0
+        for record_id in reservoir:
+            if added >= allocation[source_file]:
+                break
+            if record_id not in sample:
+                sample[record_id] = None
+                added += 1
+
+    logger.info(
+        f"Training sample: {len(sample)} records, {len(pair_reservoir)} likely duplicate pairs "
+        f"across {len(strata)} files"
+    )
+    return list(sample)[:max_rows]
+
+def select_training_sample(
+    files_hash: str,
+    records: Iterable[Tuple[str, Dict[str, str], str]],
+    config: Dict,
+    record_count: int
+) -> List[str]:
+    """
+    Return training record ids, reusing a cached sample for identical input files
+
+    The in-memory and out-of-core readers may not yield the same rows for the
+    same files, so the execution mode and record count are part of the key.
+
+    Args:
+        files_hash: Hash of the input files (hash_files), keys the cache
+        records: Iterable of (record_id, record, source_file) tuples, only
+            consumed on a cache miss
+        config: Deduplication configuration
+        record_count: Number of records loaded from the files
+
+    Returns:
+        List of sampled record ids
+    """
+    fields = [field_config['field'] for field_config in config['fields']]
+    blocking_columns = [
+        column for column in (config.get('blocking_columns') or config.get('selected_columns') or [])
+        if column in fields
+    ] or fields[:2]
+    pair_fraction = config.get('training_pair_fraction', 0.5)
+
+    cache_key = hashlib.sha256(json.dumps({
+        'files': files_hash,
+        'out_of_core': bool(config.get('out_of_core')),
+        'record_count': record_count,
+        'max_rows': config['max_training_rows'],
+        'blocking_columns': blocking_columns,
+        'pair_fraction': pair_fraction
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+    cache_path = os.path.join(SAMPLE_CACHE_DIR, f"{cache_key}.json")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r') as f:
+                record_ids = json.load(f)
+            logger.info(f"Using cached training sample {cache_path}")
+            return record_ids
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable training sample cache {cache_path}: {str(e)}")
+
+    record_ids = sample_record_ids(records, config['max_training_rows'], blocking_columns, pair_fraction)
+
+    try:
+        os.makedirs(SAMPLE_CACHE_DIR, exist_ok=True)
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(record_ids, f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not cache training sample to {cache_path}: {str(e)}")
+
+    return record_ids
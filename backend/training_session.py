@@ -0,0 +1,164 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_DIR = os.environ.get(
+    'TRAINING_SESSION_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'dedupe_training_sessions')
+)
+SESSION_TTL_SECONDS = int(os.environ.get('TRAINING_SESSION_TTL_SECONDS', 3600))
+
+# Keys the API adds to records; ignored when recognising a labelled pair
+META_FIELDS = ['confidence_score', 'source_file', 'record_id']
+
+# Session ids are issued by the server as uuid4 hex strings. Anything else is
+# rejected before it can be used to build a cache path
+SESSION_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+@dataclass
+class TrainingSession:
+    """
+    Prepared active-learning state for one labelling loop
+
+    deduper_state is a pickled snapshot of the deduper right after
+    prepare_training (or after the latest batch), so every round starts from a
+    fresh copy. files_hash ties the session to the input it was prepared on.
+    """
+    deduper_state: bytes
+    files_hash: str
+    initial_pairs: List[Dict] = field(default_factory=list)
+    marked: Set[str] = field(default_factory=set)
+
+    def load_deduper(self, labelled_pairs: List[Dict]):
+        """
+        Return a fresh copy of the deduper, ready to mark labelled_pairs
+
+        Pickling drops the state of dedupe's index predicates (their frozen
+        block keys), so the restored deduper could not mark or train on
+        anything. They are frozen again on the records the active learner
+        knows about plus the records in labelled_pairs, which also covers
+        pairs handed out in the last batch and no longer among the candidates.
+        """
+        deduper = pickle.loads(self.deduper_state)
+        learner = deduper.active_learner
+        labelled = [(pair['0'], pair['1']) for pair in labelled_pairs]
+        # DedupeBlockLearner._index_predicates is what prepare_training
+        # freezes the predicates with
+        learner.blocker._index_predicates(learner.candidates + learner.pairs + labelled)
+        return deduper
+
+    def unmarked(self, training_data: List[Dict]) -> List[Dict]:
+        """Return the labelled pairs not yet marked on this session's deduper"""
+        return [pair for pair in training_data if pair_key(pair) not in self.marked]
+
+def snapshot_deduper(deduper) -> Optional[bytes]:
+    """Pickle the deduper, or return None if it cannot be pickled"""
+    try:
+        return pickle.dumps(deduper, protocol=pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        logger.warning(f"Deduper cannot be pickled, not caching the training session: {str(e)}")
+        return None
+
+def pair_key(pair: Dict) -> str:
+    """Stable identity of a labelled pair, independent of the answer"""
+    records = [
+        {k: str(v) for k, v in pair[side].items() if k not in META_FIELDS}
+        for side in ('0', '1')
+    ]
+    return hashlib.sha256(json.dumps(records, sort_keys=True).encode('utf-8')).hexdigest()
+
+def new_session_id() -> str:
+    """Issue a random session id; ids are never derived from the input"""
+    return uuid.uuid4().hex
+
+def is_valid_session_id(session_id) -> bool:
+    """Whether session_id has the shape of an id issued by new_session_id"""
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+class TrainingSessionCache:
+    """
+    TTL cache of training sessions, in process memory and pickled to disk
+
+    The disk copy lets any worker in the pool resume a session another worker
+    prepared; the in-memory copy skips reading it back in the common case.
+    """
+
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS, max_entries: int = 16, cache_dir: Optional[str] = SESSION_CACHE_DIR):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{session_id}.pkl")
+
+    def get(self, session_id: str) -> Optional[TrainingSession]:
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid training session id: {session_id!r}")
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                created, session = entry
+                if now - created <= self.ttl_seconds:
+                    self._entries.move_to_end(session_id)
+                    return session
+                del self._entries[session_id]
+
+        if not self.cache_dir:
+            return None
+        path = self._path(session_id)
+        try:
+            created = os.path.getmtime(path)
+            if now - created > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                session = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable training session {path}: {str(e)}")
+            return None
+
+        self._remember(session_id, session, created)
+        return session
+
+    def put(self, session_id: str, session: TrainingSession):
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid training session id: {session_id!r}")
+        self._remember(session_id, session, time.time())
+        if not self.cache_dir:
+            return
+        path = self._path(session_id)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump(session, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist training session {session_id}: {str(e)}")
+
+    def _remember(self, session_id: str, session: TrainingSession, created: float):
+        with self._lock:
+            self._entries[session_id] = (created, session)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+# Shared by every job running in this process
+training_sessions = TrainingSessionCache()
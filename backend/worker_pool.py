@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Number of warm worker processes kept alive for /dedupe jobs
+WORKER_COUNT = int(os.environ.get('DEDUPE_WORKERS', 2))
+
+def _warm_worker():
+    """
+    Pool initializer: import the heavy modules once per worker process so
+    jobs never pay the dedupe/pandas/unidecode import cost
+    """
+    start = time.perf_counter()
+    import dedupe_script  # noqa: F401
+    logger.info(f"Worker {os.getpid()} warmed in {time.perf_counter() - start:.2f}s")
+
+def _ping() -> int:
+    return os.getpid()
+
+# How often the budget watchdog samples the worker
+WATCHDOG_INTERVAL = 1.0
+
+# How long an aborted worker may take to exit once its executor is idle
+RETIRE_GRACE_SECONDS = 5.0
+
+class JobBudgetExceeded(Exception):
+    """
+    Raised inside a worker when the watchdog aborts a job
+
+    Deliberately not a RuntimeError: dedupe's Dedupe.score turns any
+    RuntimeError into a generic multiprocessing hint. pid names the worker
+    that has to be recycled.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.pid = os.getpid()
+
+class JobMemoryExceeded(JobBudgetExceeded):
+    """Raised inside a worker when a job grows past its RSS budget"""
+
+class JobTimeExceeded(JobBudgetExceeded):
+    """Raised inside a worker when a job runs past its wall-clock budget"""
+
+class WorkerCrashed(RuntimeError):
+    """Raised when a worker process dies mid-job, e.g. killed by the kernel's OOM killer"""
+
+def _current_rss_mb() -> float:
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # Peak RSS in KiB on Linux; an over-estimate, but never misses a breach
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _stop_child_processes():
+    """Terminate processes the job started, such as dedupe's scoring processes when num_cores > 1"""
+    children = multiprocessing.active_children()
+    for child in children:
+        child.terminate()
+    for child in children:
+        child.join(timeout=5)
+
+def run_with_budget(job: Callable, max_rss_mb: Optional[float] = None, max_seconds: Optional[float] = None, **kwargs) -> Any:
+    """
+    Run job(**kwargs) under a SIGALRM watchdog
+
+    The watchdog checks the job against its budgets every WATCHDOG_INTERVAL
+    seconds. max_rss_mb bounds how far the process's RSS may grow during the
+    job, so memory held from earlier jobs (warm imports, caches, heap glibc
+    kept) does not count against it. Only this process is measured; dedupe's
+    scoring processes with num_cores > 1 are not.
+
+    On a breach the watchdog terminates any child processes, then aborts the
+    job by raising a JobBudgetExceeded in the job's thread. If code under the
+    job wraps or swallows that exception, the original is raised anyway.
+    Threads the job started (dedupe scores in threads when num_cores < 2) can
+    stay blocked, so the process must not run further jobs: WorkerPool
+    retires the worker.
+    """
+    if not max_rss_mb and not max_seconds:
+        return job(**kwargs)
+
+    start = time.monotonic()
+    baseline_rss_mb = _current_rss_mb() if max_rss_mb else 0.0
+    breach: Optional[JobBudgetExceeded] = None
+
+    def abort(error: JobBudgetExceeded):
+        nonlocal breach
+        breach = error
+        # Disarm first so the handler cannot fire again while the job unwinds
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        _stop_child_processes()
+        raise error
+
+    def watchdog(signum, frame):
+        elapsed = time.monotonic() - start
+        if max_seconds and elapsed > max_seconds:
+            abort(JobTimeExceeded(f"Job exceeded its {max_seconds:.0f}s time budget"))
+        if max_rss_mb:
+            growth_mb = _current_rss_mb() - baseline_rss_mb
+            if growth_mb > max_rss_mb:
+                abort(JobMemoryExceeded(f"Job exceeded its {max_rss_mb:.0f} MB memory budget (grew by {growth_mb:.0f} MB)"))
+
+    previous_handler = signal.signal(signal.SIGALRM, watchdog)
+    signal.setitimer(signal.ITIMER_REAL, WATCHDOG_INTERVAL, WATCHDOG_INTERVAL)
+    try:
+        result = job(**kwargs)
+    except Exception as e:
+        if breach is not None and e is not breach:
+            raise breach from e
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+    if breach is not None:
+        raise breach
+    return result
+
+def run_dedupe_job(max_rss_mb: Optional[float] = None, max_seconds: Optional[float] = None, **kwargs) -> Any:
+    """Entry point executed inside a warm worker: find_duplicates_in_files under the job's budgets"""
+    from dedupe_script import find_duplicates_in_files
+    return run_with_budget(find_duplicates_in_files, max_rss_mb=max_rss_mb, max_seconds=max_seconds, **kwargs)
+
+def _is_child_process(pid: int) -> bool:
+    """Whether pid is still a live child of this process, so it is safe to kill"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return False
+    # fields[0] is the state, fields[1] the parent pid; Z is an unreaped zombie
+    return fields[0] != 'Z' and int(fields[1]) == os.getpid()
+
+class WorkerPool:
+    """
+    Pre-started pool of worker processes that already hold the heavy imports
+
+    A ProcessPoolExecutor is unusable once any of its workers dies, so when a
+    job reports a broken pool the executor is replaced with a freshly warmed
+    one and ready stays False until the new workers are up. Workers are
+    recycled the same way after the watchdog aborts a job; the aborted worker
+    is killed once the old executor is idle if it has not exited by then.
+    """
+
+    def __init__(self, size: int = WORKER_COUNT):
+        self.size = size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._warm_task: Optional[asyncio.Task] = None
+        # Jobs in flight per executor, so a retired executor can drain
+        self._running: Dict[ProcessPoolExecutor, Set[asyncio.Future]] = {}
+        self._retire_tasks: Set[asyncio.Task] = set()
+        self._aborted_pids: Set[int] = set()
+        self.ready = False
+
+    def start(self):
+        """Start the workers in the background without blocking the event loop"""
+        self.ready = False
+        # spawn rather than fork so workers never inherit the server's event
+        # loop or threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_worker
+        )
+        self._warm_task = asyncio.get_running_loop().create_task(self._warm_up(self._executor))
+
+    async def _warm_up(self, executor: ProcessPoolExecutor):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            # One ping per worker forces every process to start and run the
+            # initializer before the first real job arrives
+            pids = await asyncio.gather(*[
+                loop.run_in_executor(executor, _ping) for _ in range(self.size)
+            ])
+            # A restart while warming up replaces the executor; only the
+            # current one may mark the pool ready
+            if executor is self._executor:
+                self.ready = True
+            logger.info(f"Worker pool ready with {len(set(pids))} processes in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"Worker pool warm-up failed: {str(e)}")
+
+    def restart(self, executor: ProcessPoolExecutor, reason: str):
+        """Replace executor with new warm workers, unless a concurrent job already did"""
+        if executor is not self._executor:
+            return
+        logger.warning(f"Restarting worker pool: {reason}")
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+        # Jobs still running on healthy workers of the old executor finish
+        # before its processes exit
+        executor.shutdown(wait=False)
+        self.start()
+
+    async def _retire_worker(self, executor: ProcessPoolExecutor, pid: int):
+        """Kill an aborted worker that is still alive once its old executor has no jobs left"""
+        running = self._running.get(executor)
+        if running:
+            await asyncio.wait(list(running))
+        await asyncio.sleep(RETIRE_GRACE_SECONDS)
+        self._kill_aborted_worker(pid)
+
+    def _kill_aborted_worker(self, pid: int):
+        self._aborted_pids.discard(pid)
+        if _is_child_process(pid):
+            # Typically blocked on a scoring thread of the aborted job
+            logger.warning(f"Killing aborted worker {pid}, it did not exit on its own")
+            os.kill(pid, signal.SIGKILL)
+
+    async def run(self, func: Callable, **kwargs) -> Any:
+        if self._executor is None:
+            raise RuntimeError("Worker pool has not been started")
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, _call_with_kwargs, func, kwargs)
+        running = self._running.setdefault(executor, set())
+        running.add(future)
+        try:
+            return await future
+        except JobBudgetExceeded as e:
+            # The aborted job may have left a grown heap, half-finished state
+            # or blocked threads in its worker
+            self.restart(executor, f"recycling workers after {type(e).__name__}")
+            self._aborted_pids.add(e.pid)
+            task = loop.create_task(self._retire_worker(executor, e.pid))
+            self._retire_tasks.add(task)
+            task.add_done_callback(self._retire_tasks.discard)
+            raise
+        except BrokenProcessPool as e:
+            self.restart(executor, f"a worker process died ({str(e)})")
+            raise WorkerCrashed("A worker process died while running the job, most likely out of memory") from e
+        finally:
+            running.discard(future)
+            if not running and executor is not self._executor:
+                self._running.pop(executor, None)
+
+    def shutdown(self):
+        if self._warm_task is not None:
+            self._warm_task.cancel()
+        for task in list(self._retire_tasks):
+            task.cancel()
+        # A blocked aborted worker would otherwise hold up interpreter exit
+        for pid in list(self._aborted_pids):
+            self._kill_aborted_worker(pid)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self.ready = False
+
+def _call_with_kwargs(func: Callable, kwargs: dict) -> Any:
+    return func(**kwargs)
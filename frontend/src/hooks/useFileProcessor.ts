@@ -12,6 +12,7 @@ export function useFileProcessor() {
   const [originalFileData, setOriginalFileData] = useState<any>([])
   const [progress, setProgress] = useState(0)
   const [error, setError] = useState<string | null>(null)
+  const [sessionId, setSessionId] = useState<string | null>(null)
   const [isFileNameDialogOpen, setIsFileNameDialogOpen] = useState(false)
   const [pendingDownload, setPendingDownload] = useState<{
     content: string;
@@ -38,6 +39,9 @@ export function useFileProcessor() {
       formData.append('training_data', JSON.stringify(trainingData))
       if (isReprocessing) {
         formData.append('is_reprocessing', 'true')
+      } else if (sessionId && file === originalFile) {
+        // Resume the training session prepared for this file
+        formData.append('session_id', sessionId)
       }
       selectedColumns != undefined ? formData.append('selected_columns', JSON.stringify(selectedColumns)) : null
 
@@ -68,6 +72,7 @@ export function useFileProcessor() {
         await new Promise((resolve) => setTimeout(resolve, 100))
       }
       if (result.status === 'needs_training') {
+        setSessionId(result.session_id ?? null)
         return [result, 'training'];
       } else {
         if (result.duplicates && result.duplicates.length > 0) {
@@ -144,6 +149,7 @@ export function useFileProcessor() {
     setOriginalFileData([])
     setProgress(0)
     setError(null)
+    setSessionId(null)
   }
 
   const handleDownload = (content: string, fileName: string) => {